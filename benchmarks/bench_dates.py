@@ -0,0 +1,125 @@
+"""
+Проверка и замер разбора даты сбора: прежняя логика из main.py
+против parse_date.
+
+Сравниваются все уникальные значения «Дата Сбора» из таблицы и набор
+граничных случаев; при расхождении скрипт завершается с ошибкой.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_dates [путь к csv] [повторов]
+"""
+import re
+import sys
+from datetime import datetime
+from time import perf_counter
+
+from collection_reader import CollectionReader
+from date_parser import parse_date
+
+# граничные случаи, которых может не быть в таблице
+CORPUS = [
+    "",
+    "нет данных",
+    "6/12/2005",
+    "12/31/1999",
+    "13/12/2005",
+    "6/12/05",
+    "12.06.2005",
+    "1.6.2005",
+    "12.06.05",
+    "12.06.75",
+    "12.06.205",
+    "31.02.2005",
+    "12.06/2005",
+    "12/06.2005",
+    "06.2005",
+    "6.2005",
+    "13.2005",
+    "6/2005",
+    "6-2005",
+    "1232005",
+    "2005",
+    "лето 2005 г.",
+    "0000",
+    "28-31. 07.2019",
+    "28-31.07.2019",
+    "июль 2019, 28-31. 07.2019",
+    "12.06.2005-15.06.2005",
+    "00.00.2005",
+]
+
+
+def legacy_parse_date(date_of_collect: str):
+    """Прежний разбор даты из основного цикла main.py"""
+    year = month = day = None
+    if date_of_collect != "":
+        datesStr = re.findall(
+            r"\d{1,2}[./]\d{1,2}[./]\d{2,4}|\d{1,2}.\d{4}|\d{4}|28-31\. 07\.2019",
+            date_of_collect,
+        )
+        if len(datesStr) != 0:
+            dateStr = datesStr[0]
+            if re.fullmatch(r"\d{1,2}[./]\d{1,2}[./]\d{2,4}", dateStr):
+                delim = re.findall(r"[./]", dateStr)[0]
+                if delim == "/":
+                    date_ = datetime.strptime(dateStr, f"%m{delim}%d{delim}%Y").date()
+                else:
+                    try:
+                        date_ = datetime.strptime(
+                            dateStr, f"%d{delim}%m{delim}%Y"
+                        ).date()
+                    except ValueError:
+                        date_ = datetime.strptime(
+                            dateStr, f"%d{delim}%m{delim}%y"
+                        ).date()
+                day, month, year = (date_.day, date_.month, date_.year)
+            elif len(dateStr) == 4:
+                year = int(dateStr)
+            elif re.fullmatch(r"\d{1,2}.\d{4}", dateStr):
+                month, year = map(int, dateStr.split("."))
+            elif re.fullmatch(r"28-31\. 07\.2019", dateStr):
+                month = 7
+                year = 2019
+    return day, month, year
+
+
+def outcome(fun, value):
+    """Результат разбора или признак ошибки"""
+    try:
+        return fun(value)
+    except ValueError:
+        return "ValueError"
+
+
+def measure(fun, values, repeats: int) -> float:
+    best = None
+    for _ in range(repeats):
+        parse_date.cache_clear()
+        start = perf_counter()
+        for value in values:
+            fun(value)
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == "__main__":
+    filename = sys.argv[1] if len(sys.argv) > 1 else "input_data/collection.csv"
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    with open(filename, "r", encoding="utf-8") as f:
+        values = [row.date_of_collect for row in CollectionReader(f)]
+
+    for value in sorted(set(values) | set(CORPUS)):
+        expected = outcome(legacy_parse_date, value)
+        actual = outcome(parse_date, value)
+        if expected != actual:
+            sys.exit(f"{value!r}: прежний разбор {expected}, parse_date {actual}")
+    print(f"совпадают: {len(set(values) | set(CORPUS))} уникальных значений")
+
+    slow = measure(legacy_parse_date, values, repeats)
+    fast = measure(parse_date, values, repeats)
+    print(f"строк: {len(values)}, уникальных: {len(set(values))}")
+    print(f"прежний разбор: {len(values) / slow:10.0f} строк/с")
+    print(f"parse_date:     {len(values) / fast:10.0f} строк/с")
+    print(f"ускорение: {slow / fast:.1f}x")
@@ -0,0 +1,66 @@
+"""
+Сравнение скорости чтения исходной таблицы:
+DataclassReader против CollectionReader и разбора частями
+в нескольких процессах (read_parallel).
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_reader [путь к csv] [повторов] [процессов]
+"""
+import os
+import sys
+from time import perf_counter
+
+from dataclass_csv import DataclassReader
+
+from collection_reader import COLUMN_MAPPING, CollectionReader
+from dclasses.CollectionExcelData import CollectionExcelData
+from parallel_reader import read_parallel
+
+
+def read_dataclass_csv(filename: str):
+    with open(filename, "r", encoding="utf-8") as f:
+        dt = DataclassReader(f, CollectionExcelData)
+        for column, field in COLUMN_MAPPING.items():
+            dt.map(column).to(field)
+        return list(dt)
+
+
+def read_fast(filename: str):
+    with open(filename, "r", encoding="utf-8") as f:
+        return list(CollectionReader(f))
+
+
+def measure(fun, filename: str, repeats: int):
+    best = None
+    rows = []
+    for _ in range(repeats):
+        start = perf_counter()
+        rows = fun(filename)
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return rows, best
+
+
+if __name__ == "__main__":
+    filename = sys.argv[1] if len(sys.argv) > 1 else "input_data/collection.csv"
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count() or 1
+
+    expected, slow = measure(read_dataclass_csv, filename, repeats)
+    actual, fast = measure(read_fast, filename, repeats)
+
+    if expected != actual:
+        for i, (a, b) in enumerate(zip(expected, actual)):
+            if a != b:
+                sys.exit(f"строка {i + 2} отличается:\n{a}\n{b}")
+        sys.exit(f"разное число строк: {len(expected)} и {len(actual)}")
+
+    print(f"строк: {len(actual)}")
+    print(f"DataclassReader:  {len(expected) / slow:10.0f} строк/с")
+    print(f"CollectionReader: {len(actual) / fast:10.0f} строк/с")
+    print(f"ускорение: {slow / fast:.1f}x")
+
+    parallel, fastest = measure(lambda name: read_parallel(name, workers), filename, repeats)
+    if parallel != actual:
+        sys.exit("read_parallel вернул другие строки")
+    print(f"read_parallel ({workers} проц.): {len(parallel) / fastest:10.0f} строк/с")
@@ -0,0 +1,247 @@
+"""
+Масштабный прогон нормализации на синтетических данных.
+
+Для каждого масштаба (1x, 10x, 100x, 1000x от input_data/collection.csv)
+генерируется таблица, в которой таксономия, места сбора, коллекторы и даты
+выбираются из распределений исходного файла, а часть координат смещается
+на несколько сотен метров. Нормализация запускается в отдельном процессе
+через main.run во временном каталоге с копией кеша и правил, вместо Nominatim
+подставляется заглушка, поэтому сеть не нужна, а кеш репозитория не меняется.
+
+По каждому этапу (parse, taxonomy, collectors, geo, dates, write)
+выводится скорость в строках в секунду и пик кучи Python во время этапа.
+Это не RSS процесса: tracemalloc не видит память C-расширений, mmap
+и дочерних процессов. Куча считается во втором, отдельном прогоне с той же
+таблицей: пик сбрасывается при входе в этап, поэтому на скорость первого
+прогона учёт памяти не влияет.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_scaling --scales 1,10
+    python -m benchmarks.bench_scaling --save   # сохранить базовые значения
+"""
+import argparse
+import csv
+import io
+import json
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from contextlib import redirect_stdout
+from time import perf_counter
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE = os.path.join(ROOT, "input_data", "collection.csv")
+BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+STAGES = ["parse", "taxonomy", "collectors", "geo", "dates", "write"]
+
+# доля точек, смещённых относительно исходных, и максимальное смещение (град.)
+JITTER_SHARE = 0.1
+JITTER_DEGREES = 0.003
+
+
+def generate(target: str, scale: int, seed: int = 0):
+    """Синтетическая таблица в scale раз больше исходной"""
+    rnd = random.Random(seed)
+    with open(SOURCE, "r", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        rows = list(reader)
+
+    column = {name: i for i, name in enumerate(header)}
+    # независимые распределения для коллекторов и дат
+    collectors = [row[column["Коллектор"]] for row in rows]
+    dates = [row[column["Дата Сбора"]] for row in rows]
+
+    with open(target, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for i in range(len(rows) * scale):
+            row = list(rnd.choice(rows))
+            row[column["ID taxon"]] = str(i + 1)
+            row[column["CatalogueNumber"]] = f"ZIN-TER-M-{i + 1}"
+            row[column["Коллектор"]] = rnd.choice(collectors)
+            row[column["Дата Сбора"]] = rnd.choice(dates)
+            lat, lon = row[column["Latitude"]], row[column["Longitude"]]
+            if lat and lon and float(lat) and rnd.random() < JITTER_SHARE:
+                shift = lambda: rnd.uniform(-JITTER_DEGREES, JITTER_DEGREES)
+                row[column["Latitude"]] = f"{float(lat) + shift():.8f}"
+                row[column["Longitude"]] = f"{float(lon) + shift():.8f}"
+            writer.writerow(row)
+
+
+class StubResponse:
+    def __init__(self, raw: dict):
+        self.raw = raw
+
+
+class StubNominatim:
+    """Заглушка геокодера: детерминированный ответ без сети"""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def reverse(self, query: str, **kwargs):
+        lat, lon = (float(part) for part in query.split(","))
+        return StubResponse(
+            {"address": {"country": "Stub", "state": f"{round(lat)} {round(lon)}"}}
+        )
+
+    def geocode(self, query: str, **kwargs):
+        return StubResponse({"address": {"country": "Stub", "state": query}})
+
+
+def memory_stage_timer(timer_class):
+    """
+    StageTimer, который дополнительно запоминает пик кучи Python каждого этапа
+    в peak_mb: пик tracemalloc сбрасывается при входе в этап
+    """
+
+    class MemoryStage:
+        def __init__(self, timer, name: str):
+            self.timer = timer
+            self.name = name
+            self.stage = timer_class.__call__(timer, name)
+
+        def __enter__(self):
+            tracemalloc.reset_peak()
+            self.stage.__enter__()
+            return self
+
+        def __exit__(self, *exc):
+            self.stage.__exit__(*exc)
+            peak = tracemalloc.get_traced_memory()[1] / 2**20
+            self.timer.peak_mb[self.name] = max(self.timer.peak_mb.get(self.name, 0.0), peak)
+
+    class MemoryStageTimer(timer_class):
+        def __init__(self):
+            super().__init__()
+            self.peak_mb: Dict[str, float] = {}
+
+        def __call__(self, name: str) -> MemoryStage:
+            return MemoryStage(self, name)
+
+    return MemoryStageTimer()
+
+
+def run_child(workdir: str, memory: bool) -> Dict:
+    """
+    Прогон main.run внутри подготовленного каталога;
+    при memory - с учётом пика памяти по этапам
+    """
+    import geopy.geocoders
+
+    geopy.geocoders.Nominatim = StubNominatim
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+
+    import main
+    from geo_prefetch import TokenBucket
+    from instrumentation import StageTimer
+    from sinks import CsvSink
+
+    # заглушке ограничение частоты не нужно
+    main.geocoderLimiter = TokenBucket(1e9, 1e9)
+    if memory:
+        main.stages = memory_stage_timer(StageTimer)
+        tracemalloc.start()
+
+    sink = CsvSink(main.OUTPUT_DIR)
+    with redirect_stdout(io.StringIO()):
+        try:
+            main.run(main.INPUT_FILE, sink)
+            sink.close()
+        finally:
+            main.prefetcher.shutdown()
+
+    result = {"rows": len(main.collection), "stages": dict(main.stages.totals)}
+    if memory:
+        tracemalloc.stop()
+        result["peak_mb"] = main.stages.peak_mb
+    return result
+
+
+def child_run(source: str, scale: int, memory: bool) -> Dict:
+    """Прогон в отдельном процессе на свежей копии кеша и правил"""
+    workdir = tempfile.mkdtemp(prefix=f"zin-bench-{scale}x-")
+    try:
+        os.makedirs(os.path.join(workdir, "input_data"))
+        os.makedirs(os.path.join(workdir, "output"))
+        shutil.copytree(os.path.join(ROOT, "cache"), os.path.join(workdir, "cache"))
+        shutil.copytree(os.path.join(ROOT, "rules"), os.path.join(workdir, "rules"))
+        shutil.copy(source, os.path.join(workdir, "input_data", "collection.csv"))
+        command = [sys.executable, os.path.abspath(__file__), "--child", workdir]
+        if memory:
+            command.append("--memory")
+        out = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        return json.loads(out.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_scale(scale: int) -> Dict:
+    source = tempfile.mkstemp(prefix=f"zin-bench-{scale}x-", suffix=".csv")[1]
+    try:
+        start = perf_counter()
+        generate(source, scale)
+        print(f"{scale}x: сгенерировано за {perf_counter() - start:.1f} с")
+        result = child_run(source, scale, memory=False)
+        result["peak_mb"] = child_run(source, scale, memory=True)["peak_mb"]
+        return result
+    finally:
+        os.remove(source)
+
+
+def rows_per_second(result: Dict, stage: str) -> float:
+    seconds = result["stages"].get(stage, 0.0)
+    return result["rows"] / seconds if seconds else math.inf
+
+
+def report(results: Dict[str, Dict], baseline: Dict[str, Dict]):
+    print("\nпамять - пик кучи Python по tracemalloc, без C-расширений, mmap и дочерних процессов")
+    for scale, result in results.items():
+        print(f"\n{scale}x, строк: {result['rows']}")
+        for stage in STAGES:
+            speed = rows_per_second(result, stage)
+            line = f"  {stage:<11}{speed:>14,.0f} строк/с"
+            if scale in baseline:
+                before = rows_per_second(baseline[scale], stage)
+                if math.isfinite(before) and math.isfinite(speed):
+                    line += f"  ({(speed / before - 1) * 100:+.1f}% к базовому)"
+            print(line)
+        peaks = result.get("peak_mb", {})
+        memory = ", ".join(f"{stage} {peaks[stage]:.1f} МБ" for stage in STAGES if stage in peaks)
+        print(f"  пик кучи Python: {memory}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scales", default="1,10,100,1000")
+    parser.add_argument("--save", action="store_true", help=f"записать {BASELINE}")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--memory", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.child, args.memory)))
+        sys.exit()
+
+    baseline: Dict[str, Dict] = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    scales: List[int] = [int(scale) for scale in args.scales.split(",")]
+    results = {str(scale): run_scale(scale) for scale in scales}
+    report(results, baseline)
+
+    if args.save:
+        baseline.update(results)
+        with open(BASELINE, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2)
+        print(f"\nбазовые значения сохранены в {BASELINE}")
@@ -0,0 +1,80 @@
+import json
+import os
+from threading import Lock
+from typing import Iterable, List, Optional
+
+
+class AppendLog:
+    """
+    Хранилище записей кеша в виде журнала: одна JSON-запись на строку.
+
+    Файл читается только при первом обращении. Новые записи копятся
+    в буфере и дописываются в конец файла пачкой с fsync - при заполнении
+    буфера или по вызову flush, поэтому стоимость записи не зависит от
+    размера кеша. Если журнала ещё нет, он один раз создаётся из старого
+    JSON-файла pysondb (legacy).
+    """
+
+    def __init__(
+        self, filename: str, legacy: Optional[str] = None, batch_size: int = 20
+    ):
+        self.filename = filename
+        self.legacy = legacy
+        self.batch_size = batch_size
+        self.buffer: List[str] = []
+        self.lock = Lock()
+
+    def getAll(self) -> List[dict]:
+        """Все записи журнала в порядке добавления"""
+        if not os.path.exists(self.filename):
+            self._migrate()
+        with open(self.filename, "rb+") as f:
+            content = f.read()
+            end = content.rfind(b"\n") + 1
+            if end != len(content):
+                # недописанная строка после аварийного завершения
+                f.truncate(end)
+        lines = content[:end].decode("utf-8").splitlines()
+        return [json.loads(line) for line in lines if line]
+
+    def add(self, record: dict):
+        with self.lock:
+            self.buffer.append(json.dumps(record, ensure_ascii=False) + "\n")
+            if len(self.buffer) >= self.batch_size:
+                self._write()
+
+    def flush(self):
+        """Запись накопленных записей на диск"""
+        with self.lock:
+            self._write()
+
+    def rewrite(self, records: Iterable[dict]):
+        """Атомарная перезапись журнала заданными записями (сжатие)"""
+        with self.lock:
+            self._write()
+            self._dump(records)
+
+    def _write(self):
+        if not self.buffer:
+            return
+        with open(self.filename, "a", encoding="utf-8") as f:
+            f.write("".join(self.buffer))
+            f.flush()
+            os.fsync(f.fileno())
+        self.buffer.clear()
+
+    def _migrate(self):
+        records = []
+        if self.legacy is not None and os.path.exists(self.legacy):
+            with open(self.legacy, "r", encoding="utf-8") as f:
+                records = json.load(f)["data"]
+        self._dump(records)
+
+    def _dump(self, records: Iterable[dict]):
+        tmp = self.filename + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.filename)
@@ -0,0 +1,211 @@
+import csv
+import dataclasses
+from datetime import date, datetime
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+)
+
+from dclasses.CollectionExcelData import CollectionExcelData
+
+# соответствие колонок исходной таблицы полям CollectionExcelData
+COLUMN_MAPPING: Dict[str, str] = {
+    "ID taxon": "id_taxon",
+    "CatalogueNumber": "catalog_number",
+    "Collect_ID": "collect_id",
+    "Страна": "country",
+    "Регион": "region",
+    "Субрегион": "subregion",
+    "Мест.1": "place_1",
+    "Мест.2": "place_2",
+    "Мест.3": "place_3",
+    "GEN_BANK": "gen_bank",
+    "Latitude": "latitude",
+    "Longitude": "longitude",
+    "Отряд": "order",
+    "Семейство": "family",
+    "Род": "genus",
+    "Вид": "kind",
+    "Вауч. Инст.": "vauch_inst",
+    "Вауч. Код": "vauch_code",
+    "Дата Сбора": "date_of_collect",
+    "Коллектор": "collectors",
+    "RNA": "rna",
+    "Comments": "comments",
+    "Ткань": "tissue",
+    "Пол": "sex",
+    "Возраст": "age",
+}
+
+
+def make_converter(field: dataclasses.Field) -> Callable[[Any], Any]:
+    """
+    Преобразователь значения ячейки в тип поля.
+    Пустое значение заменяется значением по умолчанию, как в DataclassReader.
+    """
+    field_type = field.type
+    if field.default is dataclasses.MISSING:
+
+        def required(value):
+            if not value:
+                raise ValueError(f"The field `{field.name}` is required.")
+            return field_type(value)
+
+        return required
+
+    default = field_type(field.default)
+    if field_type is str:
+        return lambda value: value if value else default
+    return lambda value: field_type(value) if value else default
+
+
+def compile_columns(
+    header: Sequence[str], cls: Type, mapping: Dict[str, str]
+) -> List[Tuple[int, Callable[[Any], Any]]]:
+    """
+    Однократное сопоставление заголовка полям класса:
+    для каждого поля - номер колонки (-1, если её нет) и преобразователь.
+    Колонка обязательного поля должна быть в заголовке
+    """
+    positions = {name: i for i, name in enumerate(header)}
+    stripped = {name.strip(): i for i, name in reversed(list(enumerate(header)))}
+    field_to_column = {field: column for column, field in mapping.items()}
+    columns = []
+    for field in dataclasses.fields(cls):
+        column = field_to_column.get(field.name, field.name)
+        if column in positions:
+            index = positions[column]
+        else:
+            index = stripped.get(field.name, -1)
+        if index < 0 and field.default is dataclasses.MISSING:
+            raise ValueError(f"The column `{column}` is required.")
+        columns.append((index, make_converter(field)))
+    return columns
+
+
+def convert_rows(
+    rows: Iterable[Sequence[Any]],
+    header: Sequence[str],
+    cls: Type = CollectionExcelData,
+    mapping: Dict[str, str] = COLUMN_MAPPING,
+    label: str = "CSV Line number",
+    make: Optional[Callable[..., Any]] = None,
+) -> Iterator[Any]:
+    """
+    Преобразование строк-последовательностей в объекты cls
+    (или в make(*значения полей), если make задан)
+    """
+    columns = compile_columns(header, cls, mapping)
+    make = make or cls
+    for line_number, row in enumerate(rows, start=2):
+        size = len(row)
+        try:
+            yield make(
+                *[
+                    convert(row[index] if 0 <= index < size else None)
+                    for index, convert in columns
+                ]
+            )
+        except ValueError as e:
+            raise ValueError(f"{e} [{label}: {line_number}]") from e
+
+
+class CollectionReader:
+    """
+    Быстрое чтение исходной таблицы в CollectionExcelData.
+
+    Заголовок разбирается один раз, для каждой колонки заранее
+    подготавливается преобразователь, поэтому на строку приходится
+    только вызов csv.reader и конструктора класса.
+    """
+
+    def __init__(
+        self,
+        f,
+        cls: Type = CollectionExcelData,
+        mapping: Dict[str, str] = COLUMN_MAPPING,
+    ):
+        reader = csv.reader(f)
+        header = next(reader, [])
+        self._rows = convert_rows(reader, header, cls, mapping)
+
+    def __iter__(self):
+        return self._rows
+
+    def __next__(self):
+        return next(self._rows)
+
+
+def cell_text(value: Any) -> str:
+    """
+    Значение ячейки Excel в том виде, в каком оно попало бы в CSV-выгрузку:
+    целые числа без «.0», даты - д.м.гггг, пустые ячейки - пустая строка
+    """
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, (datetime, date)):
+        return value.strftime("%d.%m.%Y")
+    return str(value)
+
+
+class XlsxCollectionReader:
+    """
+    Чтение исходной таблицы прямо из книги Excel без выгрузки в CSV.
+
+    Книга открывается в режиме только для чтения, строки листов идут
+    потоком и не загружаются целиком. Значения ячеек приводятся к тексту
+    CSV-выгрузки, дальше работают те же сопоставление колонок
+    и преобразователи, что и в CollectionReader. По умолчанию читаются
+    все листы, в заголовке которых есть хотя бы одна известная колонка.
+    Нужен пакет openpyxl.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        sheets: Optional[Sequence[str]] = None,
+        cls: Type = CollectionExcelData,
+        mapping: Dict[str, str] = COLUMN_MAPPING,
+    ):
+        self.filename = filename
+        self.sheets = sheets
+        self.cls = cls
+        self.mapping = mapping
+
+    def __iter__(self) -> Iterator[Any]:
+        try:
+            from openpyxl import load_workbook
+        except ImportError as e:
+            raise ImportError(
+                "для чтения .xlsx нужен пакет openpyxl: pip install openpyxl"
+            ) from e
+
+        workbook = load_workbook(self.filename, read_only=True, data_only=True)
+        try:
+            names = self.sheets if self.sheets is not None else workbook.sheetnames
+            known = set(self.mapping) | {f.name for f in dataclasses.fields(self.cls)}
+            for name in names:
+                rows = workbook[name].iter_rows(values_only=True)
+                header = [cell_text(value) for value in next(rows, ())]
+                if self.sheets is None and not known & {h.strip() for h in header}:
+                    continue  # лист без данных коллекции
+                texts = (
+                    [cell_text(value) for value in row]
+                    for row in rows
+                    if any(value is not None for value in row)
+                )
+                yield from convert_rows(
+                    texts, header, self.cls, self.mapping, f"{name} row"
+                )
+        finally:
+            workbook.close()
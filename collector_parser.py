@@ -0,0 +1,64 @@
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, Tuple
+
+from dclasses.Collector import Collector
+
+# «Фамилия Имя» или просто «Фамилия», кириллицей или латиницей
+COLLECTOR_PATTERN = re.compile(
+    r"[А-ЯA-Z][а-яА-Яa-z\-]+\s[А-ЯA-Z][а-яА-Яa-z\-]+|[А-ЯA-Z][а-яА-Яa-z\-]+"
+)
+
+
+@lru_cache(maxsize=None)
+def split_collectors(raw: str) -> Tuple[str, ...]:
+    """Разбиение строки из колонки «Коллектор» на отдельные имена"""
+    return tuple(COLLECTOR_PATTERN.findall(raw))
+
+
+def make_collector(id: int, name: str) -> Collector:
+    parts = name.split()
+    if len(parts) > 1:
+        return Collector(id, parts[0], parts[1], "")
+    return Collector(id, name, "", "")
+
+
+class CollectorResolver:
+    """
+    Сопоставление строки коллекторов с их id в справочнике collectors.
+
+    Результат запоминается для каждой исходной строки, так что повторная
+    строка обходится одним поиском в словаре. При очистке или замене
+    справочника нужно вызвать clear.
+    """
+
+    def __init__(self, collectors: Dict[str, Collector]):
+        self.collectors = collectors
+        self.memo: Dict[str, Tuple[int, ...]] = {}
+
+    def resolve(self, raw: str) -> Tuple[int, ...]:
+        """id коллекторов строки; новые коллекторы добавляются в справочник"""
+        ids = self.memo.get(raw)
+        if ids is None:
+            ids = tuple(self._get_id(name) for name in split_collectors(raw))
+            self.memo[raw] = ids
+        return ids
+
+    def resolve_all(self, raws: Iterable[str]):
+        """
+        Пакетное разрешение всех строк заранее, в порядке появления,
+        поэтому id совпадают с построчной обработкой
+        """
+        for raw in raws:
+            if raw not in self.memo:
+                self.resolve(raw)
+
+    def clear(self):
+        self.memo.clear()
+
+    def _get_id(self, name: str) -> int:
+        collector = self.collectors.get(name)
+        if collector is None:
+            collector = make_collector(len(self.collectors) + 1, name)
+            self.collectors[name] = collector
+        return collector.id
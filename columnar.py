@@ -0,0 +1,103 @@
+import dataclasses
+from array import array
+from typing import Iterable, Iterator, Tuple, Type
+
+# значение, которым в целочисленной колонке обозначается None
+NULL = -(2**31)
+
+
+class IntColumn:
+    """Целочисленная колонка в array('i'), None хранится как NULL"""
+
+    def __init__(self):
+        self.data = array("i")
+
+    def append(self, value):
+        self.data.append(NULL if value is None else value)
+
+    def __getitem__(self, index: int):
+        value = self.data[index]
+        return None if value == NULL else value
+
+    def __iter__(self):
+        for value in self.data:
+            yield None if value == NULL else value
+
+    def __len__(self):
+        return len(self.data)
+
+
+class StringColumn:
+    """
+    Строковая колонка со смещениями: все значения хранятся подряд
+    в одном bytearray в UTF-8, а строка задаётся концом своего участка
+    """
+
+    def __init__(self):
+        self.blob = bytearray()
+        self.ends = array("q")
+
+    def append(self, value: str):
+        self.blob += value.encode("utf-8")
+        self.ends.append(len(self.blob))
+
+    def __getitem__(self, index: int) -> str:
+        if index < 0:
+            index += len(self.ends)
+        start = self.ends[index - 1] if index > 0 else 0
+        return self.blob[start : self.ends[index]].decode("utf-8")
+
+    def __iter__(self):
+        blob = self.blob
+        start = 0
+        for end in self.ends:
+            yield blob[start:end].decode("utf-8")
+            start = end
+
+    def __len__(self):
+        return len(self.ends)
+
+
+class ColumnarTable:
+    """
+    Таблица dataclass-объектов, хранящаяся по колонкам.
+
+    Поддерживает append/extend и итерацию как список, но не держит
+    отдельный объект на каждую строку. Колонки типа int хранятся
+    в array('i'), строковые - в общем буфере со смещениями.
+    """
+
+    def __init__(self, data_class: Type):
+        self.data_class = data_class
+        self.fields = [field.name for field in dataclasses.fields(data_class)]
+        self.columns = [
+            IntColumn() if field.type is int else StringColumn()
+            for field in dataclasses.fields(data_class)
+        ]
+
+    def append(self, item):
+        for column, name in zip(self.columns, self.fields):
+            column.append(getattr(item, name))
+
+    def extend(self, items: Iterable):
+        for item in items:
+            self.append(item)
+
+    def clear(self):
+        self.columns = [type(column)() for column in self.columns]
+
+    def rows(self) -> Iterator[Tuple]:
+        """Строки в виде кортежей значений в порядке полей"""
+        return zip(*self.columns)
+
+    def column(self, name: str):
+        return self.columns[self.fields.index(name)]
+
+    def __getitem__(self, index: int):
+        return self.data_class(*(column[index] for column in self.columns))
+
+    def __iter__(self):
+        return (self.data_class(*row) for row in self.rows())
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
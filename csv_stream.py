@@ -0,0 +1,38 @@
+import csv
+import dataclasses
+from typing import Iterable, Tuple, Type
+
+
+class CsvStreamWriter:
+    """
+    Построчная запись dataclass-объектов в CSV.
+
+    Формат совпадает с DataclassWriter, но строки пишутся сразу,
+    без накопления всего списка в памяти.
+    """
+
+    def __init__(self, filename: str, data_class: Type):
+        self.data_class = data_class
+        self.file = open(filename, "w", encoding="utf-8", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([f.name for f in dataclasses.fields(data_class)])
+
+    def write(self, item):
+        self.writer.writerow(dataclasses.astuple(item))
+
+    def write_all(self, items: Iterable):
+        for item in items:
+            self.write(item)
+
+    def write_rows(self, rows: Iterable[Tuple]):
+        """Запись готовых кортежей значений в порядке полей"""
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
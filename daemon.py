@@ -0,0 +1,90 @@
+import json
+import os
+import socket
+import socketserver
+from threading import Thread
+from time import sleep
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+Request = Dict[str, Any]
+Response = Dict[str, Any]
+
+
+class FileWatcher:
+    """
+    Отслеживание изменений файлов опросом (время изменения и размер).
+    Об изменении сообщается, только когда файлы перестали меняться
+    в течение одного интервала, чтобы не читать недописанный экспорт.
+    """
+
+    def __init__(self, filenames: Sequence[str], interval: float = 1.0):
+        self.filenames = filenames
+        self.interval = interval
+        self.seen = self._signature()
+
+    def _signature(self) -> List[Optional[Tuple[int, int]]]:
+        signature = []
+        for filename in self.filenames:
+            try:
+                stat = os.stat(filename)
+            except FileNotFoundError:
+                signature.append(None)
+                continue
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        return signature
+
+    def wait(self):
+        """Ожидание следующего завершённого изменения файлов"""
+        while True:
+            sleep(self.interval)
+            current = self._signature()
+            if None in current or current == self.seen:
+                continue
+            sleep(self.interval)
+            if self._signature() == current:
+                self.seen = current
+                return
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            response = self.server.handler(request)
+        except Exception as e:
+            response = {"error": f"{type(e).__name__}: {e}"}
+        self.wfile.write(json.dumps(response, ensure_ascii=False).encode() + b"\n")
+
+
+class SubmissionServer(socketserver.ThreadingUnixStreamServer):
+    """
+    Приём заданий через локальный Unix-сокет: одна JSON-строка запроса,
+    в ответ одна JSON-строка. Запросы обрабатываются в фоновом потоке.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path: str, handler: Callable[[Request], Response]):
+        if os.path.exists(path):
+            os.remove(path)  # сокет от прошлого запуска
+        super().__init__(path, _Handler)
+        self.path = path
+        self.handler = handler
+
+    def start(self):
+        Thread(target=self.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def submit(path: str, request: Request) -> Response:
+    """Отправка запроса запущенному демону и получение ответа"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(path)
+        client.sendall(json.dumps(request, ensure_ascii=False).encode() + b"\n")
+        with client.makefile("rb") as f:
+            return json.loads(f.readline())
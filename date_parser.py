@@ -0,0 +1,62 @@
+import re
+from datetime import date
+from functools import lru_cache
+from typing import Optional, Tuple
+
+# все допустимые варианты записи даты сбора, в порядке приоритета
+DATE_PATTERN = re.compile(
+    r"(?P<first>\d{1,2})(?P<delim>[./])(?P<second>\d{1,2})(?P<delim2>[./])(?P<year>\d{2,4})"
+    r"|(?P<month_only>\d{1,2})(?P<month_delim>.)(?P<month_year>\d{4})"
+    r"|(?P<year_only>\d{4})"
+    r"|(?P<range>28-31\. 07\.2019)"
+)
+
+DateParts = Tuple[Optional[int], Optional[int], Optional[int]]
+
+
+def _short_year(year: int) -> int:
+    """Двузначный год по правилам %y"""
+    return year + (2000 if year < 69 else 1900)
+
+
+@lru_cache(maxsize=None)
+def parse_date(raw: str) -> DateParts:
+    """
+    Разбор даты сбора в (день, месяц, год), отсутствующие части - None.
+
+    Форматы: м/д/гггг, д.м.гггг, д.м.гг, м.гггг, гггг и один известный
+    диапазон. Некорректные даты вызывают ValueError, как и strptime.
+    """
+    match = DATE_PATTERN.search(raw)
+    if match is None:
+        return None, None, None
+
+    if match["first"] is not None:
+        delim = match["delim"]
+        if match["delim2"] != delim:
+            raise ValueError(f"time data {match[0]!r} has mixed delimiters")
+        first, second = int(match["first"]), int(match["second"])
+        year = match["year"]
+        if delim == "/":
+            # американский формат: месяц/день/год
+            if len(year) != 4:
+                raise ValueError(f"time data {match[0]!r} has no 4-digit year")
+            value = date(int(year), first, second)
+        elif len(year) == 4:
+            value = date(int(year), second, first)
+        elif len(year) == 2:
+            value = date(_short_year(int(year)), second, first)
+        else:
+            raise ValueError(f"time data {match[0]!r} has bad year")
+        return value.day, value.month, value.year
+
+    if match["month_only"] is not None:
+        if match["month_delim"] != ".":
+            raise ValueError(f"bad month and year {match[0]!r}")
+        return None, int(match["month_only"]), int(match["month_year"])
+
+    if match["year_only"] is not None:
+        return None, None, int(match["year_only"])
+
+    # 28-31. 07.2019
+    return None, 7, 2019
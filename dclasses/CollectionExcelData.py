@@ -4,7 +4,7 @@ from dataclass_csv import accept_whitespaces
 
 
 @accept_whitespaces
-@dataclass
+@dataclass(slots=True)
 class CollectionExcelData:
     """Класс, который описывает данные из исходной таблицы"""
     id_taxon: int
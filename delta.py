@@ -0,0 +1,202 @@
+"""
+Наборы изменений относительно предыдущего вывода.
+
+Новые таблицы сравниваются с прежними CSV из ./output/ по естественным
+ключам: collection - по id (это id_taxon), справочники - по названию и
+ключу родителя. id родителя заменяется его естественным ключом, поэтому
+строка находит свою пару, даже если справочник перенумерован. Строки
+сравниваются по хешу значений. Для каждой таблицы пишутся
+<таблица>_inserts.csv, <таблица>_updates.csv и <таблица>_deletes.csv.
+"""
+import csv
+import hashlib
+import os
+from typing import Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+from sinks import FOREIGN_KEYS, CsvSink
+
+# естественный ключ таблицы: колонки, однозначно задающие строку
+NATURAL_KEYS: Dict[str, Tuple[str, ...]] = {
+    "collection": ("id",),
+    "collectors": ("last_name", "first_name", "second_name"),
+    "countries": ("name",),
+    "regions": ("country_id", "name"),
+    "subregions": ("region_id", "name"),
+    "orders": ("name",),
+    "families": ("order_id", "name"),
+    "genuses": ("family_id", "name"),
+    "kinds": ("genus_id", "name"),
+    "institutes": ("name",),
+    "tissues": ("name",),
+    "ages": ("name",),
+    "sex": ("name",),
+    "tags": ("name",),
+    "collectors_to_collection": ("collector_id", "collection_id"),
+    "tags_to_collection": ("col_id", "tag_id"),
+}
+
+CHANGES = ("inserts", "updates", "deletes")
+
+
+def row_digest(row: List[str]) -> bytes:
+    """Хеш значений строки"""
+    return hashlib.sha1("\x1f".join(row).encode("utf-8")).digest()
+
+
+class Snapshot:
+    """
+    Набор таблиц в CSV: path(name) - файл таблицы или None, если её нет.
+    Естественные ключи строк вычисляются с заменой внешних ключей
+    на естественные ключи родителей.
+    """
+
+    def __init__(self, path: Callable[[str], Optional[str]]):
+        self.path = path
+        self._keys: Dict[str, Dict[str, Hashable]] = {}
+
+    def read(self, name: str) -> Iterator[List[str]]:
+        """Строки таблицы без заголовка; заголовок - в self.header(name)"""
+        filename = self.path(name)
+        if filename is None:
+            return
+        with open(filename, "r", encoding="utf-8", newline="") as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            yield from reader
+
+    def header(self, name: str) -> List[str]:
+        filename = self.path(name)
+        if filename is None:
+            return []
+        with open(filename, "r", encoding="utf-8", newline="") as f:
+            return next(csv.reader(f), [])
+
+    def key_func(self, name: str) -> Callable[[List[str]], Hashable]:
+        """Функция естественного ключа строки таблицы name"""
+        header = self.header(name)
+        columns = NATURAL_KEYS.get(name, tuple(header))
+        foreign_keys = FOREIGN_KEYS.get(name, {})
+        parts = []
+        for column in columns:
+            index = header.index(column)
+            if column in foreign_keys:
+                parent = self.keys(foreign_keys[column][0])
+                parts.append(lambda row, i=index, p=parent: p.get(row[i], row[i]))
+            else:
+                parts.append(lambda row, i=index: row[i])
+        return lambda row: tuple(part(row) for part in parts)
+
+    def keys(self, name: str) -> Dict[str, Hashable]:
+        """id строки -> естественный ключ, для ссылок из других таблиц"""
+        if name not in self._keys:
+            header = self.header(name)
+            keys: Dict[str, Hashable] = {}
+            if "id" in header:
+                key = self.key_func(name)
+                index = header.index("id")
+                keys = {row[index]: key(row) for row in self.read(name)}
+            self._keys[name] = keys
+        return self._keys[name]
+
+
+def unique_keys(
+    rows: Iterator[List[str]], key: Callable[[List[str]], Hashable]
+) -> Iterator[Tuple[Hashable, List[str]]]:
+    """Ключи строк; повторяющийся ключ дополняется номером повтора"""
+    seen: Dict[Hashable, int] = {}
+    for row in rows:
+        k = key(row)
+        if k in seen:
+            seen[k] += 1
+            k = (*k, seen[k])
+        else:
+            seen[k] = 0
+        yield k, row
+
+
+def diff_table(
+    name: str, old: Snapshot, new: Snapshot, write: Callable[[str, List[str]], None]
+) -> Dict[str, int]:
+    """
+    Сравнение таблицы name в двух наборах; write(изменение, строка)
+    получает новые строки для inserts и updates и прежние для deletes.
+    Возвращает число строк каждого вида изменений.
+    """
+    counts = dict.fromkeys(CHANGES, 0)
+    previous: Dict[Hashable, bytes] = {}
+    if old.header(name) == new.header(name):
+        previous = {
+            k: row_digest(row) for k, row in unique_keys(old.read(name), old.key_func(name))
+        }
+        deleted_rows = old.read(name)
+        old_key = old.key_func(name)
+    else:
+        # состав колонок изменился: таблица загружается заново
+        deleted_rows = iter(())
+        old_key = None
+        for row in old.read(name):
+            write("deletes", row)
+            counts["deletes"] += 1
+
+    for k, row in unique_keys(new.read(name), new.key_func(name)):
+        digest = previous.pop(k, None)
+        if digest is None:
+            write("inserts", row)
+            counts["inserts"] += 1
+        elif digest != row_digest(row):
+            write("updates", row)
+            counts["updates"] += 1
+
+    if previous:
+        for k, row in unique_keys(deleted_rows, old_key):
+            if k in previous:
+                write("deletes", row)
+                counts["deletes"] += 1
+    return counts
+
+
+class DeltaSink(CsvSink):
+    """
+    Вывод в CSV, как CsvSink с atomic=True, и наборы изменений
+    относительно прежних файлов в каталоге delta_directory.
+    Прежние таблицы заменяются новыми только после сравнения.
+    """
+
+    def __init__(self, directory: str, delta_directory: str):
+        super().__init__(directory, atomic=True)
+        self.delta_directory = delta_directory
+        self.counts: Dict[str, Dict[str, int]] = {}
+
+    def close(self):
+        os.makedirs(self.delta_directory, exist_ok=True)
+        names = {
+            os.path.splitext(os.path.basename(filename))[0]: filename
+            for filename in self.pending
+        }
+        existing = lambda filename: filename if os.path.exists(filename) else None
+        old = Snapshot(lambda name: existing(os.path.join(self.directory, f"{name}.csv")))
+        new = Snapshot(lambda name: existing(names[name] + ".tmp") if name in names else None)
+        for name in names:
+            # удалённые строки берутся из прежней таблицы
+            headers = dict.fromkeys(CHANGES, new.header(name))
+            headers["deletes"] = old.header(name) or headers["deletes"]
+            files = {
+                change: open(
+                    os.path.join(self.delta_directory, f"{name}_{change}.csv"),
+                    "w",
+                    encoding="utf-8",
+                    newline="",
+                )
+                for change in CHANGES
+            }
+            try:
+                writers = {change: csv.writer(f) for change, f in files.items()}
+                for change, writer in writers.items():
+                    writer.writerow(headers[change])
+                self.counts[name] = diff_table(
+                    name, old, new, lambda change, row: writers[change].writerow(row)
+                )
+            finally:
+                for f in files.values():
+                    f.close()
+        super().close()
@@ -0,0 +1,344 @@
+import re
+import time
+from math import asin, ceil, cos, floor, radians, sin, sqrt
+from threading import Lock
+from typing import Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+
+class GeoCache:
+    """
+    Индекс в памяти поверх хранилища кеша.
+
+    Записи загружаются из хранилища один раз, при первом обращении,
+    и раскладываются в словарь по ключу, поэтому поиск выполняется за O(1).
+    Подписчики (subscribe) получают записи с данными из снимка кеша на начало
+    запуска: загруженные из хранилища, а добавленные позже - только при
+    publish(). Поэтому их индексы не зависят от порядка работы потоков
+    и процессов во время запуска.
+
+    Отрицательные записи (data равно None, в reason причина, в failed время
+    неудачи) хранят запросы, на которые геокодер не ответил. Запись с
+    данными заменяет отрицательную, а устаревшая по negative_ttl[reason]
+    (сек) отрицательная запись считается отсутствующей.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        storage,
+        key_func: Callable[[dict], Hashable],
+        negative_ttl: Optional[Dict[str, float]] = None,
+    ):
+        self.name = name
+        self.storage = storage
+        self.key_func = key_func
+        self.negative_ttl = negative_ttl or {}
+        self.hits = 0
+        self.misses = 0
+        self.listeners: List[Callable[[dict], None]] = []
+        self._index: Optional[Dict[Hashable, dict]] = None
+        # записи, добавленные после снимка, и их ключи
+        self._added: List[dict] = []
+        self._fresh: Set[Hashable] = set()
+        self.lock = Lock()
+
+    @property
+    def index(self) -> Dict[Hashable, dict]:
+        if self._index is None:
+            with self.lock:
+                if self._index is None:
+                    self._index = self._load()
+        return self._index
+
+    def _load(self) -> Dict[Hashable, dict]:
+        index: Dict[Hashable, dict] = {}
+        for record in self.storage.getAll():
+            # при дубликатах оставляем первую запись, как и getByQuery,
+            # но отрицательную запись заменяет следующая
+            key = self.key_func(record)
+            known = index.get(key)
+            if known is None or is_negative(known):
+                index[key] = record
+                self._notify(record)
+        return index
+
+    def _notify(self, record: dict):
+        if not is_negative(record):
+            for listener in self.listeners:
+                listener(record)
+
+    def expired(self, record: dict) -> bool:
+        """Устарела ли отрицательная запись"""
+        ttl = self.negative_ttl.get(record.get("reason"), 0)
+        return time.time() - record.get("failed", 0) >= ttl
+
+    def known(self, key: Hashable) -> bool:
+        """Есть ли действующая запись, без подсчёта попаданий"""
+        record = self.index.get(key)
+        return record is not None and not (is_negative(record) and self.expired(record))
+
+    def loaded(self, key: Hashable) -> bool:
+        """Была ли запись по ключу в снимке кеша на начало запуска"""
+        return key in self.index and key not in self._fresh
+
+    def subscribe(self, listener: Callable[[dict], None]):
+        self.listeners.append(listener)
+
+    def publish(self):
+        """
+        Новый снимок перед следующим запуском: подписчики получают записи,
+        добавленные с загрузки или с прошлого publish
+        """
+        with self.lock:
+            added, self._added = self._added, []
+            self._fresh.clear()
+        for record in added:
+            self._notify(record)
+
+    def get(self, key: Hashable) -> Optional[dict]:
+        """
+        Получение записи по ключу с подсчётом попаданий;
+        отрицательная запись возвращается, пока не устарела
+        """
+        record = self.index.get(key)
+        if record is not None and is_negative(record) and self.expired(record):
+            record = None
+        if record is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return record
+
+    def add(self, record: dict):
+        """Сохранение записи в хранилище и в индекс"""
+        index = self.index
+        key = self.key_func(record)
+        with self.lock:
+            self.storage.add(record)
+            known = index.get(key)
+            # ответ или повторная неудача заменяют отрицательную запись
+            if known is None or is_negative(known):
+                index[key] = record
+                self._added.append(record)
+                self._fresh.add(key)
+
+    def flush(self):
+        self.storage.flush()
+
+    def compact(self) -> int:
+        """
+        Перезапись хранилища без дубликатов и устаревших отрицательных
+        записей; возвращает число удалённых
+        """
+        self.flush()
+        records = self.storage.getAll()
+        index = self.index
+        with self.lock:
+            for key in [k for k, r in index.items() if is_negative(r) and self.expired(r)]:
+                del index[key]
+        self.storage.rewrite(index.values())
+        return len(records) - len(index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def to_json(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "records": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+    def report(self) -> str:
+        total = self.hits + self.misses
+        ratio = self.hits / total if total else 0
+        return (
+            f"{self.name}: {len(self)} записей, "
+            f"попаданий {self.hits}, промахов {self.misses} ({ratio:.1%})"
+        )
+
+
+def is_negative(record: dict) -> bool:
+    """Отрицательная запись: запрос без ответа геокодера"""
+    return record.get("data") is None
+
+
+# средний радиус Земли, км
+EARTH_RADIUS_KM = 6371.0
+# длина одного градуса широты, км
+KM_PER_DEGREE = 111.2
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Расстояние между двумя точками по поверхности Земли в км"""
+    lat1, lon1, lat2, lon2 = map(radians, (lat1, lon1, lat2, lon2))
+    a = (
+        sin((lat2 - lat1) / 2) ** 2
+        + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * asin(sqrt(a))
+
+
+class NearestIndex:
+    """
+    Сеточный пространственный индекс по закешированным точкам.
+
+    Точки раскладываются по ячейкам размером max_distance_km, поэтому
+    для поиска соседей достаточно просмотреть несколько соседних ячеек.
+    """
+
+    def __init__(self, max_distance_km: float):
+        self.max_distance_km = max_distance_km
+        self.cell = max(max_distance_km, 0.001) / KM_PER_DEGREE
+        self.grid: Dict[Tuple[int, int], List[Tuple[float, float, dict]]] = {}
+        self.resolved = 0
+
+    def _cell_of(self, lat: float, lon: float) -> Tuple[int, int]:
+        return floor(lat / self.cell), floor(lon / self.cell)
+
+    def add(self, lat: float, lon: float, data: dict):
+        self.grid.setdefault(self._cell_of(lat, lon), []).append((lat, lon, data))
+
+    def find(self, lat: float, lon: float) -> Optional[dict]:
+        """Поиск по ближайшим точкам с подсчётом удачных определений"""
+        found = self.lookup(lat, lon)
+        if found is not None:
+            self.resolved += 1
+        return found
+
+    def lookup(self, lat: float, lon: float) -> Optional[dict]:
+        """
+        Поиск данных по ближайшим точкам в пределах max_distance_km.
+        Возвращает None, если соседей нет или они расходятся в стране/регионе.
+        """
+        if self.max_distance_km <= 0:
+            return None
+        cy, cx = self._cell_of(lat, lon)
+        # градус долготы сужается к полюсам, поэтому по долготе смотрим шире
+        lon_cells = ceil(1 / max(cos(radians(lat)), 0.01))
+        found = None
+        for y in range(cy - 1, cy + 2):
+            for x in range(cx - lon_cells, cx + lon_cells + 1):
+                for p_lat, p_lon, data in self.grid.get((y, x), ()):
+                    if haversine_km(lat, lon, p_lat, p_lon) > self.max_distance_km:
+                        continue
+                    if found is None:
+                        found = data
+                    elif found != data:
+                        return None  # неоднозначно
+        return found
+
+
+# сокращения в описаниях мест и их полные формы
+ABBREVIATIONS = {
+    "обл": "область",
+    "р-н": "район",
+    "р-он": "район",
+    "респ": "республика",
+    "г": "город",
+    "пос": "поселок",
+    "окр": "окрестности",
+    "хр": "хребет",
+    "оз": "озеро",
+    "ао": "автономный округ",
+}
+
+PUNCTUATION = re.compile(r"[^\w\s-]+")
+NUMBER = re.compile(r"\d+")
+
+
+def canonical_geocode(query: str) -> str:
+    """
+    Каноническая форма запроса: нижний регистр, ё -> е, без знаков
+    препинания и лишних пробелов, сокращения раскрыты
+    """
+    words = PUNCTUATION.sub(" ", query.lower().replace("ё", "е")).split()
+    return " ".join(ABBREVIATIONS.get(word, word) for word in words)
+
+
+def trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class FuzzyGeocodeIndex:
+    """
+    Поиск закешированного запроса, близкого к новому.
+
+    Сначала сравниваются канонические формы, затем - сходство по
+    триграммам (коэффициент Жаккара) среди запросов с той же страной,
+    то есть с тем же первым словом, и с теми же числами: «регион 4» и
+    «регион 6» не сопоставляются. Совпадение принимается, только если
+    все подходящие запросы дают одинаковый результат. Найденные
+    соответствия сохраняются в matches для проверки.
+    """
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.canonical: Dict[str, Tuple[str, Optional[dict]]] = {}
+        # страна -> триграмма -> канонические запросы
+        self.postings: Dict[str, Dict[str, Set[str]]] = {}
+        self.grams: Dict[str, Set[str]] = {}
+        self.matches: List[Tuple[str, str, float]] = []
+        self.lock = Lock()
+
+    def add(self, query: str, data: dict):
+        key = canonical_geocode(query)
+        with self.lock:
+            if key in self.canonical:
+                known, known_data = self.canonical[key]
+                if known_data != data:
+                    # разные ответы на одинаковые по смыслу запросы
+                    self.canonical[key] = (known, None)
+                return
+            self.canonical[key] = (query, data)
+            grams = self.grams[key] = trigrams(key)
+            postings = self.postings.setdefault(key.split(" ", 1)[0], {})
+            for gram in grams:
+                postings.setdefault(gram, set()).add(key)
+
+    def lookup(self, query: str) -> Optional[Tuple[str, dict, float]]:
+        """Закешированный запрос, его данные и сходство, либо None"""
+        if self.threshold > 1:
+            return None
+        key = canonical_geocode(query)
+        # индекс пополняется при загрузке кеша и при publish
+        with self.lock:
+            return self._lookup(key)
+
+    def _lookup(self, key: str) -> Optional[Tuple[str, dict, float]]:
+        if key in self.canonical:
+            known, data = self.canonical[key]
+            return None if data is None else (known, data, 1.0)
+
+        grams = trigrams(key)
+        postings = self.postings.get(key.split(" ", 1)[0], {})
+        shared: Dict[str, int] = {}
+        for gram in grams:
+            for candidate in postings.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+
+        numbers = NUMBER.findall(key)
+        best = None
+        for candidate, count in shared.items():
+            similarity = count / (len(grams) + len(self.grams[candidate]) - count)
+            if similarity < self.threshold or NUMBER.findall(candidate) != numbers:
+                continue
+            known, data = self.canonical[candidate]
+            if data is None or (best is not None and best[1] != data):
+                return None  # неоднозначно
+            if best is None or similarity > best[2]:
+                best = (known, data, similarity)
+        return best
+
+    def find(self, query: str) -> Optional[dict]:
+        """Поиск с записью найденного соответствия"""
+        found = self.lookup(query)
+        if found is None:
+            return None
+        known, data, similarity = found
+        with self.lock:
+            self.matches.append((query, known, similarity))
+        return data
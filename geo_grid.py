@@ -0,0 +1,126 @@
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_INDEX = {char: i for i, char in enumerate(GEOHASH_ALPHABET)}
+# знаков после запятой в координатах центра ячейки geohash
+CENTER_DECIMALS = 7
+
+
+def geohash_encode(lat: float, lon: float, precision: int) -> str:
+    """Geohash точки длиной precision символов"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        rng, coord = (lon_range, lon) if even else (lat_range, lat)
+        middle = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coord >= middle:
+            value |= 1
+            rng[0] = middle
+        else:
+            rng[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = value = 0
+    return "".join(chars)
+
+
+def geohash_decode(geohash: str) -> Tuple[float, float]:
+    """Центр ячейки geohash (широта, долгота)"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = GEOHASH_INDEX[char]
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            middle = (rng[0] + rng[1]) / 2
+            if value >> shift & 1:
+                rng[0] = middle
+            else:
+                rng[1] = middle
+            even = not even
+    return (lat_range[0] + lat_range[1]) / 2, (lon_range[0] + lon_range[1]) / 2
+
+
+class Quantizer:
+    """
+    Привязка координат к сетке перед обращением к геокодеру.
+
+    Режимы задаются строкой: "decimals:N" - округление до N знаков после
+    запятой, "geohash:P" - центр ячейки geohash длиной P. Все точки
+    ячейки заменяются одной точкой сетки, поэтому для ячейки нужен один
+    запрос и одна запись в кеше. Количество строк по ячейкам собирается
+    в cells для отчёта.
+    """
+
+    def __init__(self, mode: str, precision: int):
+        if mode not in ("decimals", "geohash"):
+            raise ValueError(f"неизвестный режим привязки к сетке: {mode!r}")
+        self.mode = mode
+        self.precision = precision
+        self.cells: Counter = Counter()
+        self.labels: Dict[Tuple[float, float], str] = {}
+        # число учтённых строк и точка последней из них
+        self.counted = 0
+        self.last: Optional[Tuple[float, float]] = None
+
+    @classmethod
+    def parse(cls, spec: Optional[str]) -> Optional["Quantizer"]:
+        """Quantizer из строки вида "decimals:4"; None для пустой строки"""
+        if not spec:
+            return None
+        mode, _, precision = spec.partition(":")
+        if not precision.isdigit():
+            raise ValueError(f"ожидается режим:точность, получено {spec!r}")
+        return cls(mode, int(precision))
+
+    def label(self, lat: float, lon: float) -> str:
+        if self.mode == "geohash":
+            return geohash_encode(lat, lon, self.precision)
+        return f"{lat:.{self.precision}f},{lon:.{self.precision}f}"
+
+    def snap(self, lat: float, lon: float) -> Tuple[float, float]:
+        """Точка сетки, к которой относятся координаты"""
+        if self.mode == "geohash":
+            center = geohash_decode(geohash_encode(lat, lon, self.precision))
+            return round(center[0], CENTER_DECIMALS), round(center[1], CENTER_DECIMALS)
+        return round(lat, self.precision), round(lon, self.precision)
+
+    def count(self, lat: float, lon: float) -> Tuple[float, float]:
+        """snap с учётом строки в отчёте по ячейкам"""
+        point = self.snap(lat, lon)
+        if point not in self.labels:
+            self.labels[point] = self.label(lat, lon)
+        self.cells[point] += 1
+        self.counted += 1
+        self.last = point
+        return point
+
+    def merge(self, report: List[Tuple[str, float, float, int]]):
+        """Учёт отчёта по ячейкам из другого процесса"""
+        for label, lat, lon, rows in report:
+            self.labels.setdefault((lat, lon), label)
+            self.cells[(lat, lon)] += rows
+
+    def reset(self):
+        self.cells.clear()
+        self.counted = 0
+        self.last = None
+
+    def report(self) -> List[Tuple[str, float, float, int]]:
+        """
+        Ячейки по убыванию числа строк, при равенстве - по метке:
+        метка, широта, долгота, строк
+        """
+        return sorted(
+            ((self.labels[point], point[0], point[1], rows) for point, rows in self.cells.items()),
+            key=lambda cell: (-cell[3], cell[0], cell[1], cell[2]),
+        )
@@ -0,0 +1,140 @@
+import multiprocessing
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from threading import Lock
+from time import monotonic, sleep
+from typing import Callable, Dict, Hashable
+
+
+class TokenBucket:
+    """
+    Ограничитель частоты запросов (token bucket).
+
+    Nominatim разрешает не более 1 запроса в секунду, поэтому все обращения
+    к геокодеру проходят через общий ограничитель, а не через sleep перед
+    каждым вызовом. При shared=True состояние хранится в общей памяти,
+    и ограничение действует сразу на все процессы пула, созданного после
+    ограничителя (monotonic на Linux общий для процессов).
+    """
+
+    def __init__(self, rate: float, capacity: float = 1, shared: bool = False):
+        self.rate = rate
+        self.capacity = capacity
+        # токены и время последнего пополнения
+        if shared:
+            self.state = multiprocessing.Array("d", [capacity, monotonic()])
+            self.lock = self.state.get_lock()
+        else:
+            self.state = [capacity, monotonic()]
+            self.lock = Lock()
+
+    def acquire(self):
+        """Ожидание свободного токена"""
+        while True:
+            with self.lock:
+                now = monotonic()
+                tokens, updated = self.state[0], self.state[1]
+                tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+                self.state[1] = now
+                if tokens >= 1:
+                    self.state[0] = tokens - 1
+                    return
+                self.state[0] = tokens
+                wait = (1 - tokens) / self.rate
+            sleep(wait)
+
+
+class GeoPrefetcher:
+    """
+    Пул потоков, который заранее разрешает уникальные запросы к геокодеру.
+
+    Каждый ключ отправляется в сеть не более одного раза; основной цикл
+    забирает готовый результат через pop и тем временем продолжает
+    обрабатывать остальные строки.
+    """
+
+    def __init__(self, workers: int):
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.pending: Dict[Hashable, Future] = {}
+
+    def submit(self, key: Hashable, fun: Callable, *args):
+        if key not in self.pending:
+            self.pending[key] = self.executor.submit(fun, *args)
+
+    def discard(self, key: Hashable):
+        """Забыть ключ, результат которого уже взят из кеша"""
+        self.pending.pop(key, None)
+
+    def pop(self, key: Hashable):
+        """Результат для ключа (с ожиданием) или None, если ключ не ставился"""
+        future = self.pending.pop(key, None)
+        return None if future is None else future.result()
+
+    def wait(self):
+        """
+        Ожидание всех запросов; их результаты к этому моменту уже в кеше.
+        Неудачный запрос не прерывает ожидание, строку с ним обработает основной цикл
+        """
+        wait(self.pending.values())
+        self.pending.clear()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+class RetryBudget:
+    """Общий на запуск запас повторов запросов к геокодеру"""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.left = total
+        self.lock = Lock()
+
+    def reset(self):
+        """Новый запуск: запас снова полный"""
+        with self.lock:
+            self.left = self.total
+
+    def take(self) -> bool:
+        """Взять один повтор; False, если запас исчерпан"""
+        with self.lock:
+            if self.left <= 0:
+                return False
+            self.left -= 1
+            return True
+
+
+class CircuitBreaker:
+    """
+    Размыкатель цепи для геокодера.
+
+    После threshold неудачных запросов подряд геокодер считается
+    недоступным до конца запуска (до reset): новые запросы
+    не отправляются, геоданные берутся только из кеша.
+    """
+
+    def __init__(self, threshold: int):
+        self.threshold = threshold
+        self.failures = 0
+        self.open = False
+        self.lock = Lock()
+
+    def reset(self):
+        """Новый запуск: цепь снова замкнута"""
+        with self.lock:
+            self.failures = 0
+            self.open = False
+
+    def record(self, success: bool) -> bool:
+        """Учёт результата запроса; True, если цепь только что разомкнулась"""
+        with self.lock:
+            if success:
+                self.failures = 0
+                return False
+            self.failures += 1
+            if self.open or self.failures < self.threshold:
+                return False
+            self.open = True
+            return True
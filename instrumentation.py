@@ -0,0 +1,130 @@
+import json
+import sys
+from threading import Lock
+from time import monotonic, perf_counter
+from typing import Any, Dict, Iterable, Iterator, Optional, TextIO
+
+
+class Stage:
+    """Замер одного этапа; используется как контекстный менеджер"""
+
+    def __init__(self, timer: "StageTimer", name: str):
+        self.timer = timer
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.add(self.name, perf_counter() - self.start)
+
+
+class StageTimer:
+    """Накопленное время выполнения этапов обработки"""
+
+    def __init__(self):
+        self.totals: Dict[str, float] = {}
+        self.stages: Dict[str, Stage] = {}
+
+    def __call__(self, name: str) -> Stage:
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = Stage(self, name)
+        return stage
+
+    def add(self, name: str, seconds: float):
+        self.totals[name] = self.totals.get(name, 0.0) + seconds
+
+    def merge(self, totals: Dict[str, float]):
+        for name, seconds in totals.items():
+            self.add(name, seconds)
+
+    def timed(self, name: str, items: Iterable) -> Iterator:
+        """Итерация с учётом времени получения каждого элемента"""
+        iterator = iter(items)
+        while True:
+            start = perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(name, perf_counter() - start)
+                return
+            self.add(name, perf_counter() - start)
+            yield item
+
+    def reset(self):
+        self.totals.clear()
+
+
+class CallStats:
+    """Количество и длительность обращений к внешнему сервису"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.failures = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, seconds: float, ok: bool):
+        with self.lock:
+            self.calls += 1
+            self.failures += 0 if ok else 1
+            self.seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+
+    def merge(self, stats: Dict[str, float]):
+        with self.lock:
+            self.calls += stats["calls"]
+            self.failures += stats["failures"]
+            self.seconds += stats["seconds"]
+            self.max_seconds = max(self.max_seconds, stats["max_seconds"])
+
+    def to_json(self) -> Dict[str, float]:
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "seconds": self.seconds,
+            "avg_seconds": self.seconds / self.calls if self.calls else 0.0,
+            "max_seconds": self.max_seconds,
+        }
+
+
+class Progress:
+    """Строка прогресса не чаще одного раза в interval секунд"""
+
+    def __init__(self, interval: float = 2.0, stream: Optional[TextIO] = None):
+        self.interval = interval
+        self.stream = stream
+        self.count = 0
+        self.start = self.last = monotonic()
+
+    def update(self, count: int = 1):
+        self.count += count
+        now = monotonic()
+        if now - self.last >= self.interval:
+            self.last = now
+            self._print(now)
+
+    def finish(self):
+        self._print(monotonic())
+
+    def _print(self, now: float):
+        elapsed = now - self.start
+        speed = self.count / elapsed if elapsed else 0.0
+        print(
+            f"обработано строк: {self.count} ({speed:.0f} строк/с)",
+            file=self.stream or sys.stderr,
+            flush=True,
+        )
+
+
+def write_report(filename: str, report: Dict[str, Any]):
+    """Запись итогового отчёта о запуске в JSON"""
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
@@ -1,16 +1,25 @@
-from dataclasses import dataclass
-import re
-from datetime import date, datetime
-from os import chdir
-from typing import List, Dict, Tuple
-from time import sleep
-
+import argparse
+import cProfile
+import csv
+from collections import Counter
+from dataclasses import dataclass, replace
+from multiprocessing import Pool
+from threading import Lock
+import os
+import signal
+import tracemalloc
+from typing import Any, Callable, Iterable, Iterator, List, Dict, Optional, Sequence, Tuple, Union
+from time import perf_counter, sleep, time
+
+from geopy.exc import (
+    ConfigurationError,
+    GeocoderAuthenticationFailure,
+    GeocoderInsufficientPrivileges,
+    GeocoderNotFound,
+    GeocoderQueryError,
+)
 from geopy.geocoders import Nominatim
 
-from pysondb import db
-
-from dataclass_csv import DataclassReader, DataclassWriter
-
 # import dataclasses
 from dclasses.Tag import Tag, TagToCollection
 from dclasses.Age import Age
@@ -29,19 +38,130 @@ from dclasses.SubRegion import SubRegion
 from dclasses.Tissue import Tissue
 from dclasses.VoucherInstitute import VoucherInstitute
 
+from cache_log import AppendLog
+from collection_reader import CollectionReader, XlsxCollectionReader
+from collector_parser import CollectorResolver
+from daemon import FileWatcher, SubmissionServer, submit
+from delta import DeltaSink
+from columnar import ColumnarTable
+from date_parser import parse_date
+from geo_cache import FuzzyGeocodeIndex, GeoCache, NearestIndex
+from geo_grid import Quantizer
+from geo_prefetch import CircuitBreaker, GeoPrefetcher, RetryBudget, TokenBucket
+from instrumentation import CallStats, Progress, StageTimer, write_report
+from parallel_reader import read_parallel
+from query import CollectionIndex
+from region_rules import RegionRules
+from sinks import CsvSink, SqliteSink
+from state_store import Checkpoint, RowState, StateStore, fingerprint, inputs_digest
+from taxonomy import TaxonomyResolver
+
+INPUT_FILE = "input_data/collection.csv"
+# входные данные: один файл csv/xlsx или несколько, читаемых подряд
+Inputs = Union[str, Sequence[str]]
+OUTPUT_DIR = "./output"
+# наборы изменений относительно прежнего содержимого OUTPUT_DIR
+DELTA_DIR = "./output/delta"
+SQLITE_FILE = "./output/collection.sqlite"
+# отчёт о запуске и профили для --profile
+REPORT_FILE = "./output/report.json"
+PROFILE_FILE = "./output/profile.prof"
+# состояние для инкрементальных запусков
+STATE_FILE = "./cache/state.json"
+# контрольная точка полного запуска для --resume и период её записи, сек
+CHECKPOINT_FILE = "./cache/checkpoint.json"
+CHECKPOINT_INTERVAL = 60.0
+# запросы, определённые по похожим закешированным описаниям
+FUZZY_LOG_FILE = "./output/geocode_fuzzy.csv"
+# строки, для которых не удалось получить геоданные, для ручной проверки
+REVIEW_FILE = "./output/unresolved.csv"
+# строки по ячейкам сетки координат (при POSITION_QUANTIZATION)
+GRID_REPORT_FILE = "./output/geo_cells.csv"
+# правила нормализации регионов и запросов к геокодеру
+REGION_RULES_FILE = "./rules/regions.csv"
+# сокет для заданий демону и период опроса входного файла, сек
+DAEMON_SOCKET = "./cache/daemon.sock"
+WATCH_INTERVAL = 1.0
+
 geolocator = Nominatim(user_agent="zin-data-lab")
 
-posDb = db.getDb("./cache/poscache.json")
-geocodeDb = db.getDb("./cache/geocodecache.json")
+# политика Nominatim: не более 1 запроса в секунду
+GEOCODER_RATE = 1.0
+# количество потоков для предварительного геокодирования
+GEOCODER_WORKERS = 4
+# максимальная пауза между повторами, сек
+RETRY_MAX_DELAY = 60
+# попыток на один запрос и общий запас повторов на запуск
+RETRY_ATTEMPTS = 5
+RETRY_BUDGET = 100
+# после стольких запросов подряд, не получивших ответа за все попытки,
+# запуск продолжается только по кешу; больше RETRY_ATTEMPTS
+BREAKER_THRESHOLD = 10
+# ошибки, которые не исправятся повтором: неверный запрос, ответы 4xx
+PERMANENT_ERRORS = (
+    ConfigurationError,
+    GeocoderAuthenticationFailure,
+    GeocoderInsufficientPrivileges,
+    GeocoderNotFound,
+    GeocoderQueryError,
+)
+# срок хранения отрицательных записей кеша, сек: пустой ответ и ошибка
+NEGATIVE_TTL = {"empty": 30 * 24 * 3600, "error": 24 * 3600}
+
+# общий для процессов --workers: ограничение частоты действует на все сразу
+geocoderLimiter = TokenBucket(GEOCODER_RATE, shared=True)
+retryBudget = RetryBudget(RETRY_BUDGET)
+geocoderBreaker = CircuitBreaker(BREAKER_THRESHOLD)
+prefetcher = GeoPrefetcher(GEOCODER_WORKERS)
+
+# журналы кеша геокодера; старые JSON-файлы pysondb переносятся в них
+# при первом обращении
+posDb = AppendLog("./cache/poscache.jsonl", legacy="./cache/poscache.json")
+geocodeDb = AppendLog("./cache/geocodecache.jsonl", legacy="./cache/geocodecache.json")
+
+# время этапов обработки
+stages = StageTimer()
+# обращения к Nominatim
+geocoderStats = CallStats()
+# прогресс обработки строк
+progress = Progress()
+# контрольная точка для продолжения прерванного запуска
+checkpoint = Checkpoint(CHECKPOINT_FILE)
+
+# индексы кешей в памяти, загружаются при первом обращении
+posCache = GeoCache("poscache", posDb, lambda r: (r["lat"], r["lon"]), NEGATIVE_TTL)
+geocodeCache = GeoCache("geocodecache", geocodeDb, lambda r: r["geocode"], NEGATIVE_TTL)
+
+# максимальное расстояние до точки из кеша на начало запуска (км), при котором
+# координаты определяются без запроса к Nominatim; 0 - отключить
+NEAREST_MAX_DISTANCE_KM = 0.5
+posNearest = NearestIndex(NEAREST_MAX_DISTANCE_KM)
+posCache.subscribe(lambda r: posNearest.add(r["lat"], r["lon"], r["data"]))
+
+# привязка координат к сетке перед запросом к геокодеру: None - точные
+# координаты, "decimals:N" - округление до N знаков, "geohash:P" - центр
+# ячейки geohash длиной P; все точки ячейки определяются одним запросом
+POSITION_QUANTIZATION = None
+positionGrid = Quantizer.parse(POSITION_QUANTIZATION)
+
+# минимальное сходство описаний (по триграммам), при котором результат
+# берётся из кеша на начало запуска вместо ответа Nominatim; больше 1 - отключить
+GEOCODE_SIMILARITY = 0.85
+geocodeFuzzy = FuzzyGeocodeIndex(GEOCODE_SIMILARITY)
+geocodeCache.subscribe(lambda r: geocodeFuzzy.add(r["geocode"], r["data"]))
+
+regionRules = RegionRules.load(REGION_RULES_FILE)
 
 # вауч. институты
 institutes: Dict[str, VoucherInstitute] = {}
 # авторы
 collectors: Dict[str, Collector] = {}
+# разбор строк коллекторов с запоминанием
+collectorResolver = CollectorResolver(collectors)
 # коллекция
-collection: List[Collection] = []
+collection = ColumnarTable(Collection)
 # коллектор к коллекции
-collectors_to_collection: List[CollectorToCollection] = []
+collectors_to_collection = ColumnarTable(CollectorToCollection)
 # отряды
 orders: Dict[str, Order] = {}
 # семейства
@@ -94,42 +214,39 @@ ages = {
 
 tags = {"rna": Tag(1, "rna")}
 
-tags_to_collection: List[TagToCollection] = []
+tags_to_collection = ColumnarTable(TagToCollection)
 
 # плохие значения
 invalid_values: List[str] = ["неизвестен", "?", ""]
 
 
-def get_collection(filename: str) -> List[CollectionExcelData]:
-    """Получение коллекции, с помощью списка из csv"""
-    with open(filename, "r", encoding="utf-8") as f:
-        dt = DataclassReader(f, CollectionExcelData)
-        dt.map("ID taxon").to("id_taxon")
-        dt.map("CatalogueNumber").to("catalog_number")
-        dt.map("Collect_ID").to("collect_id")
-        dt.map("Страна").to("country")
-        dt.map("Регион").to("region")
-        dt.map("Субрегион").to("subregion")
-        dt.map("Мест.1").to("place_1")
-        dt.map("Мест.2").to("place_2")
-        dt.map("Мест.3").to("place_3")
-        dt.map("GEN_BANK").to("gen_bank")
-        dt.map("Latitude").to("latitude")
-        dt.map("Longitude").to("longitude")
-        dt.map("Отряд").to("order")
-        dt.map("Семейство").to("family")
-        dt.map("Род").to("genus")
-        dt.map("Вид").to("kind")
-        dt.map("Вауч. Инст.").to("vauch_inst")
-        dt.map("Вауч. Код").to("vauch_code")
-        dt.map("Дата Сбора").to("date_of_collect")
-        dt.map("Коллектор").to("collectors")
-        dt.map("RNA").to("rna")
-        dt.map("Comments").to("comments")
-        dt.map("Ткань").to("tissue")
-        dt.map("Пол").to("sex")
-        dt.map("Возраст").to("age")
-        return list(dt)
+def get_collection(inputs: Inputs, workers: int = 1) -> List[CollectionExcelData]:
+    """
+    Получение коллекции, с помощью списка из csv или xlsx.
+    При workers > 1 файлы csv разбираются частями в нескольких процессах.
+    """
+    if workers <= 1:
+        return list(iter_collection(inputs))
+    rows: List[CollectionExcelData] = []
+    for filename in [inputs] if isinstance(inputs, str) else inputs:
+        if filename.lower().endswith(".xlsx"):
+            rows.extend(iter_collection(filename))
+        else:
+            rows.extend(read_parallel(filename, workers))
+    return rows
+
+
+def iter_collection(inputs: Inputs) -> Iterator[CollectionExcelData]:
+    """
+    Построчное чтение коллекции из csv или книг xlsx (все листы с данными).
+    Несколько файлов читаются подряд, как одна таблица.
+    """
+    for filename in [inputs] if isinstance(inputs, str) else inputs:
+        if filename.lower().endswith(".xlsx"):
+            yield from XlsxCollectionReader(filename)
+        else:
+            with open(filename, "r", encoding="utf-8") as f:
+                yield from CollectionReader(f)
 
 
 def process_value(value: str):
@@ -138,12 +255,8 @@ def process_value(value: str):
     return "" if value in invalid_values else value.strip().lower()
 
 
-def get_or_create(container: map, key, create_func):
-    """Если ключа key в словаре container нет – создаёт объект с помощью create_func и добавляет его,
-    затем возвращает объект по этому ключу."""
-    if key not in container:
-        container[key] = create_func()
-    return container[key]
+# разбор таксономии с запоминанием
+taxonomyResolver = TaxonomyResolver(orders, families, genuses, kinds, process_value)
 
 
 @dataclass
@@ -159,19 +272,85 @@ def geo_data_from_json(obj) -> GeoData:
     return GeoData(obj["country"], obj["region"])
 
 
+class GeocodeUnresolved(Exception):
+    """
+    Геоданные не получены. reason: empty - геокодер ничего не нашёл,
+    error - запрос не удался, offline - геокодер отключён размыкателем
+    """
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+# строки без геоданных: id_taxon, тип запроса, запрос, причина
+unresolved: List[Tuple[int, str, str, str]] = []
+
+
 def retry(fun):
     """
-    Бесконечный повтор при ошибке с экспоненциальным таймаутом
+    Повтор при ошибке с экспоненциальным таймаутом: не более RETRY_ATTEMPTS
+    попыток и RETRY_BUDGET повторов за запуск, PERMANENT_ERRORS
+    не повторяются. Частота запросов ограничивается geocoderLimiter.
+    geocoderBreaker учитывает запрос один раз, когда попытки кончились,
+    а при разомкнутом geocoderBreaker запросы не отправляются.
     """
     secs = 0.8
-    while True:
+    for attempt in range(1, RETRY_ATTEMPTS + 1):
+        if geocoderBreaker.open:
+            raise GeocodeUnresolved("offline")
+        geocoderLimiter.acquire()
+        start = perf_counter()
         try:
-            sleep(secs)
             data = fun()
-            return data
         except Exception as e:
-            secs *= 2
+            geocoderStats.record(perf_counter() - start, False)
             print(e)
+            if (
+                isinstance(e, PERMANENT_ERRORS)
+                or attempt == RETRY_ATTEMPTS
+                or not retryBudget.take()
+            ):
+                if geocoderBreaker.record(False):
+                    print(
+                        f"геокодер недоступен: {BREAKER_THRESHOLD} запросов подряд "
+                        "без ответа, дальше только кеш"
+                    )
+                raise GeocodeUnresolved("error") from e
+            sleep(secs)
+            secs = min(secs * 2, RETRY_MAX_DELAY)
+        else:
+            geocoderStats.record(perf_counter() - start, True)
+            geocoderBreaker.record(True)
+            return data
+
+
+def fetch_geodata(cache: GeoCache, obj: dict, fun) -> GeoData:
+    """
+    Запрос к геокодеру с сохранением ответа в кеш. Пустой ответ и ошибка
+    сохраняются отрицательной записью, чтобы не повторять запрос
+    до истечения NEGATIVE_TTL.
+    """
+    try:
+        data = retry(fun)
+    except GeocodeUnresolved as e:
+        if e.reason == "error":
+            cache.add({**obj, "data": None, "reason": "error", "failed": int(time())})
+        raise
+    if data is None:
+        cache.add({**obj, "data": None, "reason": "empty", "failed": int(time())})
+        raise GeocodeUnresolved("empty")
+    geodata = get_geodata_by_raw(data.raw)
+    obj["data"] = geodata.to_json()
+    cache.add(obj)
+    return geodata
+
+
+def cached_geodata(record: dict) -> GeoData:
+    """Геоданные из записи кеша; для отрицательной - GeocodeUnresolved"""
+    if record["data"] is None:
+        raise GeocodeUnresolved(record["reason"])
+    return geo_data_from_json(record["data"])
 
 
 def get_geodata_by_raw(raw: dict) -> GeoData:
@@ -201,94 +380,110 @@ def get_geodata_by_raw(raw: dict) -> GeoData:
     return GeoData(address["country"], sub)
 
 
+def position_key(lat: float, lon: float, count: bool = False) -> Tuple[float, float]:
+    """
+    Координаты, по которым ищутся геоданные: сами координаты, если они
+    уже есть в кеше, иначе точка сетки positionGrid (если она задана).
+    count - учесть строку в отчёте по ячейкам
+    """
+    if positionGrid is None or (lat, lon) in posCache.index:
+        return lat, lon
+    return positionGrid.count(lat, lon) if count else positionGrid.snap(lat, lon)
+
+
 def get_geo_by_position(lat: float, lon: float) -> GeoData:
     """Получение геоданных на основе координат с кеширование"""
-    obj = {"type": "position", "lat": lat, "lon": lon}
-    cached = posDb.getByQuery(obj)
-    if len(cached) != 0:
-        return geo_data_from_json(cached[0]["data"])
-    data = retry(lambda: geolocator.reverse(f"{lat}, {lon}", language="ru"))
-    geodata = get_geodata_by_raw(data.raw)
-    obj["data"] = geodata.to_json()
-    posDb.add(obj)
-    return geodata
+    lat, lon = position_key(lat, lon, count=True)
+    cached = posCache.get((lat, lon))
+    if cached is not None:
+        prefetcher.discard(("position", lat, lon))
+        return cached_geodata(cached)
+    prefetched = prefetcher.pop(("position", lat, lon))
+    if prefetched is not None:
+        return prefetched
+    # пробуем определить по соседним точкам из кеша на начало запуска
+    near = posNearest.find(lat, lon)
+    if near is not None:
+        return geo_data_from_json(near)
+    return fetch_geo_by_position(lat, lon)
+
+
+def fetch_geo_by_position(lat: float, lon: float) -> GeoData:
+    """Запрос геоданных по координатам у Nominatim с сохранением в кеш"""
+    return fetch_geodata(
+        posCache,
+        {"type": "position", "lat": lat, "lon": lon},
+        lambda: geolocator.reverse(f"{lat}, {lon}", language="ru"),
+    )
 
 
 def get_geo_by_geocode(geocode: str) -> GeoData:
     """Получение геоданных на основе описания с кешированием"""
-    obj = {"type": "geocode", "geocode": geocode}
-    cached = geocodeDb.getByQuery(obj)
-    if len(cached) != 0:
-        return geo_data_from_json(cached[0]["data"])
-    data = retry(
-        lambda: geolocator.geocode(geocode, addressdetails=True, language="ru")
+    cached = geocodeCache.get(geocode)
+    if cached is not None and geocodeCache.loaded(geocode):
+        prefetcher.discard(("geocode", geocode))
+        return cached_geodata(cached)
+    # похожее описание из кеша на начало запуска проверяется раньше
+    # ответов, полученных за время запуска: иначе результат зависел бы
+    # от того, успел ли поток предзагрузки
+    similar = geocodeFuzzy.find(geocode)
+    if similar is not None:
+        prefetcher.discard(("geocode", geocode))
+        return geo_data_from_json(similar)
+    if cached is not None:
+        prefetcher.discard(("geocode", geocode))
+        return cached_geodata(cached)
+    prefetched = prefetcher.pop(("geocode", geocode))
+    if prefetched is not None:
+        return prefetched
+    return fetch_geo_by_geocode(geocode)
+
+
+def fetch_geo_by_geocode(geocode: str) -> GeoData:
+    """Запрос геоданных по описанию у Nominatim с сохранением в кеш"""
+    return fetch_geodata(
+        geocodeCache,
+        {"type": "geocode", "geocode": geocode},
+        lambda: geolocator.geocode(geocode, addressdetails=True, language="ru"),
     )
-    print(geocode)
-    print(data.raw)
-    geodata = get_geodata_by_raw(data.raw)
-    obj["data"] = geodata.to_json()
-    geocodeDb.add(obj)
-    return geodata
 
 
 def normalize_region(region: str):
     """
-    Нормализуем данные региона
-    """
-
-    if region.endswith(", Республика"):
-        return region[:-12]
-    if region.startswith("Респ."):
-        return region[5:]
-    if region == "Восточный Казахстан":
-        return "Восточно-Казахстанская область"
-    if region.endswith("р-н") or region.endswith("р-он"):
-        return region[:-4]
-
-    # синонимы названий
-    region_mapping = {
-        "x": "",
-        "X": "",
-        "неизвестно": "",
-        "хр. Хан-Ху-Хэя": "",  # хребет, не понятно где может быть
-        "Дэгэл-Гол": "",  # не понятно где (очень старая запись)
-        "Западный Хэнтей": "Хэнтий",
-        "Гоби-Алтайский аймак": "Говь-Алтай",
-        "Булганский аймак": "Булган",
-        "Араратская долина": "Армавирская область",
-        "Зандижан": "Зенджан",
-        "Алма-Атинская обл.": "Алматинская область",
-        "Зандиван": "Зангилан",
-        "Баян-Хонгорский аймак": "Баянхонгор",
-        "окр.Улан-Батора": "Улан-Батор",
-        "окр. кишлака Зебон": "Зебон",
-        "Chamadan": "Хамадан",
-        "Саадат-Шах": "Saadat Shahr",
-        "Havcheshme": "Hawizeh Marshes",
-        "Алайская долина": "Алайский район",
-        "окрестности Бишкека": "Бишкек",
-        "Халабский хребет": "Лорийская область",
-        "Памбакский хр.": "Котайкская область",
-        "вост. горы Агарац": "Ширакская область",
-        "Кобдосский аймак": "Ховд",
-        "Каракаралинский уезд": "Карагандинская область",  # Российская империя
-        "Хэнтей": "Хэнтий",
-        "кишлак Ташахур": "Шахринавский район",  # это что
-        "горный Бадахшан, Памир": "Горно-Бадахшанская автономная область",
-        "Убсунурский аймак": "Увс",
-        "Сухэ-Баторский аймак": "Сухэ-Батор",
-        "Хэнтэйский аймак": "Хэнтий",
-        "Зайсанская котловина": "Восточно-Казахстанская область",
-        "окр. кишлака Похтакор": "Пахтакор",
-        "окр. оз. Косогол": "Хубсугул",
-    }
-    if region in region_mapping:
-        return region_mapping[region]
-    if "Пенджикент" in region or "Пенджакент" in region:
-        return "Пенджикент"
-    if "Худжанда" in region:
-        return "Худжанд"
-    return region
+    Нормализуем данные региона по правилам из REGION_RULES_FILE
+    """
+    return regionRules.normalize(region)
+
+
+def get_geocode_query(row: CollectionExcelData) -> str:
+    """
+    Формирование запроса к геокодеру для строки без координат
+    """
+    region = (
+        row.region
+        if row.region.strip() != ""
+        else (row.place_2 if (row.place_1 == row.country) else row.place_1)
+    )
+    query = f"{row.country} {normalize_region(region)}"
+    return regionRules.normalize_query(query)
+
+
+def prefetch_geodata(rows: Iterable[CollectionExcelData]):
+    """
+    Постановка в очередь всех уникальных запросов, которых нет в кеше.
+    Сетевые запросы выполняются в фоне, пока идёт основной цикл.
+    """
+    for row in rows:
+        if row.latitude != 0 and row.longitude != 0:
+            lat, lon = position_key(row.latitude, row.longitude)
+            if posCache.known((lat, lon)) or posNearest.lookup(lat, lon):
+                continue
+            prefetcher.submit(("position", lat, lon), fetch_geo_by_position, lat, lon)
+        else:
+            query = get_geocode_query(row)
+            if geocodeCache.known(query):
+                continue
+            prefetcher.submit(("geocode", query), fetch_geo_by_geocode, query)
 
 
 def add_geodata(countries, regions, data: GeoData):
@@ -307,207 +502,836 @@ def add_geodata(countries, regions, data: GeoData):
     return region_id
 
 
-if __name__ == "__main__":
-    bad_data_collection = get_collection("input_data/collection.csv")
-    for row in bad_data_collection:
-        year: int = None
-        month: int = None
-        day: int = None
-        country_id = 0
-        vauch_inst_id: int = None
-
-        # получение отряда
-        order = process_value(row.order)
-        order_id = get_or_create(
-            orders, order, lambda: Order(len(orders) + 1, order)
-        ).id
-
-        # получение семейства
-        family = process_value(row.family)
-        family_id = get_or_create(
-            families,
-            (order_id, family),
-            lambda: Family(len(families) + 1, order_id, family),
-        ).id
-
-        # получение рода
-        genus = process_value(row.genus)
-        genus_id = get_or_create(
-            genuses,
-            (family_id, genus),
-            lambda: Genus(len(genuses) + 1, family_id, genus),
-        ).id
-
-        kind = process_value(row.kind)
-        kind_id = get_or_create(
-            kinds,
-            (genus_id, kind),
-            lambda: Kind(len(kinds) + 1, genus_id, kind),
-        ).id
-
-        # получение института
-        if row.vauch_inst != "":
-            if row.vauch_inst not in institutes.keys():
-                institutes[row.vauch_inst] = VoucherInstitute(
-                    len(institutes) + 1, row.vauch_inst
-                )
-            vauch_inst_id = institutes[row.vauch_inst].id
-        # получение коллекторов
-        if row.collectors != "":
-            cols = re.findall(
-                r"[А-ЯA-Z][а-яА-Яa-z\-]+\s[А-ЯA-Z][а-яА-Яa-z\-]+|[А-ЯA-Z][а-яА-Яa-z\-]+",
-                row.collectors,
+def process_row(
+    row: CollectionExcelData, kind_id: Optional[int] = None
+) -> Tuple[Collection, List[CollectorToCollection], List[TagToCollection]]:
+    """
+    Нормализация одной строки исходной таблицы: заполняет словари-справочники
+    и возвращает запись коллекции вместе со связями с коллекторами и метками.
+    kind_id - id вида, уже полученный пакетным разбором таксономии
+    """
+    collector_links: List[CollectorToCollection] = []
+    tag_links: List[TagToCollection] = []
+    country_id = 0
+    vauch_inst_id: int = None
+
+    if kind_id is None:
+        with stages("taxonomy"):
+            # отряд -> семейство -> род -> вид
+            kind_id = taxonomyResolver.resolve(row.order, row.family, row.genus, row.kind)
+
+    # получение института
+    if row.vauch_inst != "":
+        if row.vauch_inst not in institutes.keys():
+            institutes[row.vauch_inst] = VoucherInstitute(
+                len(institutes) + 1, row.vauch_inst
             )
-            for collector in cols:
-
-                if collector not in collectors.keys():
-                    if len(collector.split()) > 1:
-                        collectors[collector] = Collector(
-                            len(collectors) + 1,
-                            collector.split()[0],
-                            collector.split()[1],
-                            "",
-                        )
-                    else:
-                        collectors[collector] = Collector(
-                            len(collectors) + 1, collector, "", ""
-                        )
-
-                collectors_to_collection.append(
-                    CollectorToCollection(collectors[collector].id, row.id_taxon)
-                )
-
-        # корректировка значения точки
-        point = ""
+        vauch_inst_id = institutes[row.vauch_inst].id
+    # получение коллекторов
+    with stages("collectors"):
+        for collector_id in collectorResolver.resolve(row.collectors):
+            collector_links.append(CollectorToCollection(collector_id, row.id_taxon))
 
-        if row.latitude != 0 and row.longitude != 0:
-            point = f"Point({row.longitude} {row.latitude})"
-            print(row.id_taxon)
-            data = get_geo_by_position(row.latitude, row.longitude)
+    # корректировка значения точки
+    point = ""
 
+    with stages("geo"):
+        try:
+            if row.latitude != 0 and row.longitude != 0:
+                point = f"Point({row.longitude} {row.latitude})"
+                lookup = ("position", f"{row.latitude}, {row.longitude}")
+                data = get_geo_by_position(row.latitude, row.longitude)
+            else:
+                lookup = ("geocode", get_geocode_query(row))
+                data = get_geo_by_geocode(lookup[1])
             region_id = add_geodata(countries, regions, data)
-        else:
-            print(row.id_taxon)
+        except GeocodeUnresolved as e:
+            # строка не задерживает обработку, а попадает в REVIEW_FILE
+            region_id = None
+            unresolved.append((row.id_taxon, *lookup, e.reason))
+
+    # обработка даты
+    with stages("dates"):
+        day, month, year = parse_date(row.date_of_collect)
+
+    # получение пола
+    sex = sexes[row.sex.lower().strip()]
+    sex_id = sexes[row.sex.lower().strip()].id if (sex != None) else None
+
+    # получение возраста экземпляра
+    age = ages[row.age.lower()]
+    age_id = ages[row.age.lower()].id if (age != None) else None
+
+    if row.vauch_code == "б/н":
+        row.vauch_code = ""
+
+    # ТКАНЬ
+    if row.tissue.strip() not in tissues.keys():
+        tissues[row.tissue.strip()] = Tissue(len(tissues), row.tissue.strip())
+
+    if row.rna != "":
+        tag_links.append(TagToCollection(row.id_taxon, tags["rna"].id))
+
+    return (
+        Collection(
+            row.id_taxon,
+            row.collect_id,
+            kind_id,
+            region_id,
+            # subregion_id,
+            row.gen_bank,
+            point,
+            vauch_inst_id,
+            row.vauch_code,
+            day,
+            month,
+            year,
+            sex_id,
+            age_id,
+            row.comments,
+            ", ".join(
+                [row.place_2, row.place_3]
+            ),  # теперь сохраняем только последнии данные о позиции
+        ),
+        collector_links,
+        tag_links,
+    )
 
-            region = (
-                row.region
-                if row.region.strip() != ""
-                else (row.place_2 if (row.place_1 == row.country) else row.place_1)
-            )
-            query = f"{row.country} {normalize_region(region)}"
-            if query == "Грузия Лаго-Наки":
-                query = "Россия Лаго-Наки"
-            if query == "Россия Виварная":  # 6069
-                query = "Россия"
-            data = get_geo_by_geocode(query)
-            region_id = add_geodata(countries, regions, data)
 
-        # обработка даты
-        if row.date_of_collect != "":
-            datesStr = re.findall(
-                r"\d{1,2}[./]\d{1,2}[./]\d{2,4}|\d{1,2}.\d{4}|\d{4}|28-31\. 07\.2019",
-                row.date_of_collect,
+# справочники, которые заполняются во время обработки строк
+DIMENSIONS = {
+    "orders": orders,
+    "families": families,
+    "genuses": genuses,
+    "kinds": kinds,
+    "countries": countries,
+    "regions": regions,
+    "collectors": collectors,
+    "institutes": institutes,
+    "tissues": tissues,
+}
+DIMENSION_CLASSES = {
+    "orders": Order,
+    "families": Family,
+    "genuses": Genus,
+    "kinds": Kind,
+    "countries": Country,
+    "regions": Region,
+    "collectors": Collector,
+    "institutes": VoucherInstitute,
+    "tissues": Tissue,
+}
+
+# таблицы, накапливаемые при обработке строк
+CHECKPOINT_TABLES = {
+    "collection": collection,
+    "collectors_to_collection": collectors_to_collection,
+    "tags_to_collection": tags_to_collection,
+}
+
+
+def normalize_chunk(rows: List[CollectionExcelData]):
+    """
+    Обработка части строк в отдельном процессе.
+    Справочники очищаются, поэтому id в результате локальны для этой части.
+    """
+    for dimension in DIMENSIONS.values():
+        dimension.clear()
+    collectorResolver.clear()
+    taxonomyResolver.clear()
+    for cache in (posCache, geocodeCache):
+        cache.hits = cache.misses = 0
+    posNearest.resolved = 0
+    geocodeFuzzy.matches.clear()
+    unresolved.clear()
+    if positionGrid is not None:
+        positionGrid.reset()
+    stages.reset()
+    geocoderStats.reset()
+    processed = [process_row(row) for row in rows]
+    posCache.flush()
+    geocodeCache.flush()
+    stats = {
+        "poscache": (posCache.hits, posCache.misses),
+        "geocodecache": (geocodeCache.hits, geocodeCache.misses),
+        "nearest": posNearest.resolved,
+        "fuzzy": list(geocodeFuzzy.matches),
+        "unresolved": list(unresolved),
+        "cells": positionGrid.report() if positionGrid is not None else [],
+        "stages": dict(stages.totals),
+        "geocoder": geocoderStats.to_json(),
+    }
+    return dict(DIMENSIONS), processed, stats
+
+
+def merge_stats(stats: Dict[str, Any]):
+    """Учёт статистики кешей и времени этапов из процесса-обработчика"""
+    for cache in (posCache, geocodeCache):
+        hits, misses = stats[cache.name]
+        cache.hits += hits
+        cache.misses += misses
+    posNearest.resolved += stats["nearest"]
+    geocodeFuzzy.matches.extend(stats["fuzzy"])
+    unresolved.extend(stats["unresolved"])
+    if positionGrid is not None:
+        positionGrid.merge(stats["cells"])
+    stages.merge(stats["stages"])
+    geocoderStats.merge(stats["geocoder"])
+
+
+def merge_dimension(
+    target: Dict, local: Dict, make_key: Callable[[Any], Any], make_item, start: int = 1
+) -> Dict[int, int]:
+    """
+    Перенос локального справочника в общий в порядке первого появления.
+    Возвращает соответствие локальных id общим.
+    """
+    id_map = {}
+    for key, item in local.items():
+        new_key = make_key(key)
+        if new_key not in target:
+            target[new_key] = make_item(item, len(target) + start, new_key)
+        id_map[item.id] = target[new_key].id
+    return id_map
+
+
+def merge_chunk(local: Dict[str, Dict], processed, stats: Dict[str, Any]):
+    """
+    Слияние результата обработки части строк с общими справочниками
+    и перенумерация id так, как если бы строки обрабатывались подряд
+    """
+    merge_stats(stats)
+    same = lambda key: key
+    order_map = merge_dimension(
+        orders, local["orders"], same, lambda o, id, key: replace(o, id=id)
+    )
+    family_map = merge_dimension(
+        families,
+        local["families"],
+        lambda key: (order_map[key[0]], key[1]),
+        lambda f, id, key: replace(f, id=id, order_id=key[0]),
+    )
+    genus_map = merge_dimension(
+        genuses,
+        local["genuses"],
+        lambda key: (family_map[key[0]], key[1]),
+        lambda g, id, key: replace(g, id=id, family_id=key[0]),
+    )
+    kind_map = merge_dimension(
+        kinds,
+        local["kinds"],
+        lambda key: (genus_map[key[0]], key[1]),
+        lambda k, id, key: replace(k, id=id, genus_id=key[0]),
+    )
+    country_map = merge_dimension(
+        countries, local["countries"], same, lambda c, id, key: replace(c, id=id)
+    )
+    region_map = merge_dimension(
+        regions,
+        local["regions"],
+        lambda key: (country_map[key[0]], key[1]),
+        lambda r, id, key: replace(r, id=id, country_id=key[0]),
+    )
+    collector_map = merge_dimension(
+        collectors, local["collectors"], same, lambda c, id, key: replace(c, id=id)
+    )
+    institute_map = merge_dimension(
+        institutes, local["institutes"], same, lambda i, id, key: replace(i, id=id)
+    )
+    # id тканей начинаются с 0
+    merge_dimension(
+        tissues, local["tissues"], same, lambda t, id, key: replace(t, id=id), start=0
+    )
+
+    for item, collector_links, tag_links in processed:
+        item.kind_id = kind_map[item.kind_id]
+        # строки без геоданных остаются без региона
+        if item.region_id is not None:
+            item.region_id = region_map[item.region_id]
+        if item.vouch_inst_id is not None:
+            item.vouch_inst_id = institute_map[item.vouch_inst_id]
+        for link in collector_links:
+            link.collector_id = collector_map[link.collector_id]
+    return processed
+
+
+def write_dimensions(sink):
+    """
+    Запись справочников, накопленных во время обработки
+    """
+    sink.write("collectors", list(collectors.values()), Collector)
+    sink.write("countries", list(countries.values()), Country)
+    sink.write("regions", list(regions.values()), Region)
+    sink.write("subregions", list(subregions.values()), SubRegion)
+    sink.write("orders", list(orders.values()), Order)
+    sink.write("families", list(families.values()), Family)
+    sink.write("genuses", list(genuses.values()), Genus)
+    sink.write("kinds", list(kinds.values()), Kind)
+    sink.write("institutes", list(institutes.values()), VoucherInstitute)
+    sink.write("tissues", list(tissues.values()), Tissue)
+    sink.write("ages", list(filter(lambda age: age != None, set(ages.values()))), Age)
+    sink.write("sex", list(filter(lambda sex: sex != None, set(sexes.values()))), Sex)
+    sink.write("tags", list(tags.values()), Tag)
+
+
+def run_stream(inputs: Inputs, sink):
+    """
+    Потоковая обработка: строки читаются, нормализуются и сразу пишутся
+    в collection и таблицы связей, в памяти остаются только справочники
+    """
+    prefetch_geodata(iter_collection(inputs))
+    print(f"запросов к геокодеру в очереди: {len(prefetcher)}")
+    with sink.table("collection", Collection) as collection_out, sink.table(
+        "collectors_to_collection", CollectorToCollection
+    ) as collectors_out, sink.table("tags_to_collection", TagToCollection) as tags_out:
+        for row in stages.timed("parse", iter_collection(inputs)):
+            item, collector_links, tag_links = process_row(row)
+            with stages("write"):
+                collection_out.write(item)
+                collectors_out.write_all(collector_links)
+                tags_out.write_all(tag_links)
+            progress.update()
+    with stages("write"):
+        write_dimensions(sink)
+
+
+def run(
+    inputs: Inputs, sink, workers: int = 1, parse_workers: int = 1, resume: bool = False
+):
+    """
+    Обработка с накоплением всех строк в памяти.
+    При workers > 1 строки делятся на части и обрабатываются в пуле процессов,
+    при parse_workers > 1 так же частями разбираются файлы csv.
+    Иначе строки обрабатываются подряд с контрольными точками,
+    при resume - начиная с последней сохранённой.
+    """
+    with stages("parse"):
+        bad_data_collection = get_collection(inputs, parse_workers)
+    prefetch_geodata(bad_data_collection)
+    print(f"запросов к геокодеру в очереди: {len(prefetcher)}")
+    if workers > 1:
+        # процессы-обработчики берут геоданные из уже заполненного кеша
+        prefetcher.wait()
+        # буферы журналов не должны попасть в дочерние процессы
+        posCache.flush()
+        geocodeCache.flush()
+        size = max(1, -(-len(bad_data_collection) // (workers * 4)))
+        chunks = [
+            bad_data_collection[i : i + size]
+            for i in range(0, len(bad_data_collection), size)
+        ]
+        with Pool(workers) as pool:
+            results = [
+                merge_chunk(*result) for result in pool.imap(normalize_chunk, chunks)
+            ]
+        for result in results:
+            for item, collector_links, tag_links in result:
+                collection.append(item)
+                collectors_to_collection.extend(collector_links)
+                tags_to_collection.extend(tag_links)
+                progress.update()
+    else:
+        digest = inputs_digest([inputs] if isinstance(inputs, str) else inputs)
+        position = restore_checkpoint(digest) if resume else 0
+        with stages("taxonomy"):
+            kind_ids = taxonomyResolver.resolve_all(
+                (row.order, row.family, row.genus, row.kind)
+                for row in bad_data_collection
             )
-            # debug
-            if len(datesStr) == 0:
-                pass
-            else:
-                dateStr = datesStr[0]
-                if re.fullmatch(r"\d{1,2}[./]\d{1,2}[./]\d{2,4}", dateStr):
-                    delim = re.findall(r"[./]", dateStr)[0]
-                    date_: date
-
-                    if delim == "/":
-                        date_ = datetime.strptime(
-                            dateStr, f"%m{delim}%d{delim}%Y"
-                        ).date()
-                    else:
-                        try:
-                            date_ = datetime.strptime(
-                                dateStr, f"%d{delim}%m{delim}%Y"
-                            ).date()
-                        except ValueError:
-                            date_ = datetime.strptime(
-                                dateStr, f"%d{delim}%m{delim}%y"
-                            ).date()
-                    # print(el)
-                    day, month, year = (date_.day, date_.month, date_.year)
-                elif len(dateStr) == 4:
-                    year = int(dateStr)
-                elif re.fullmatch(r"\d{1,2}.\d{4}", dateStr):
-                    month, year = map(int, dateStr.split("."))
-                elif re.fullmatch(r"28-31\. 07\.2019", dateStr):
-                    month = 7
-                    year = 2019
-                    # Добавить комментарий в поле
-                else:
-                    pass  # debug
-
-        # получение пола
-        sex = sexes[row.sex.lower().strip()]
-        sex_id = sexes[row.sex.lower().strip()].id if (sex != None) else None
-
-        # получение возраста экземпляра
-        age = ages[row.age.lower()]
-        age_id = ages[row.age.lower()].id if (age != None) else None
-
-        if row.vauch_code == "б/н":
-            row.vauch_code = ""
-
-        # ТКАНЬ
-        if row.tissue.strip() not in tissues.keys():
-            tissues[row.tissue.strip()] = Tissue(len(tissues), row.tissue.strip())
-
-        if row.rna != "":
-            tags_to_collection.append(TagToCollection(row.id_taxon, tags["rna"].id))
-
-        collection.append(
-            Collection(
-                row.id_taxon,
-                row.collect_id,
-                kind_id,
-                region_id,
-                # subregion_id,
-                row.gen_bank,
-                point,
-                vauch_inst_id,
-                row.vauch_code,
-                day,
-                month,
-                year,
-                sex_id,
-                age_id,
-                row.comments,
-                ", ".join(
-                    [row.place_2, row.place_3]
-                ),  # теперь сохраняем только последнии данные о позиции
+        with stages("collectors"):
+            collectorResolver.resolve_all(
+                row.collectors for row in bad_data_collection
             )
+        saved = perf_counter()
+        # размеры отчётов до текущей строки, пока она не обработана
+        marks = None
+        try:
+            for row, kind_id in zip(bad_data_collection[position:], kind_ids[position:]):
+                marks = report_marks()
+                item, collector_links, tag_links = process_row(row, kind_id)
+                collection.append(item)
+                collectors_to_collection.extend(collector_links)
+                tags_to_collection.extend(tag_links)
+                progress.update()
+                position += 1
+                marks = None
+                if perf_counter() - saved >= CHECKPOINT_INTERVAL:
+                    save_checkpoint(digest, position)
+                    saved = perf_counter()
+        except BaseException:
+            # справочники могут содержать часть текущей строки: при
+            # продолжении она обработается заново и найдёт их на месте,
+            # а её записи в отчётах отбрасываются по marks
+            save_checkpoint(digest, position, marks)
+            raise
+
+    write_results(sink)
+
+
+def report_marks() -> Tuple[int, int, int]:
+    """Размеры журналов unresolved, похожих описаний и отчёта по ячейкам"""
+    counted = positionGrid.counted if positionGrid is not None else 0
+    return len(unresolved), len(geocodeFuzzy.matches), counted
+
+
+def save_checkpoint(
+    digest: str, position: int, marks: Optional[Tuple[int, int, int]] = None
+):
+    """
+    Контрольная точка после position строк вместе с ответами геокодера.
+    marks - report_marks() перед необработанной до конца строкой:
+    её записи в отчётах в точку не попадают
+    """
+    posCache.flush()
+    geocodeCache.flush()
+    unresolved_count, fuzzy_count, counted = marks or report_marks()
+    cells = Counter(positionGrid.cells) if positionGrid is not None else Counter()
+    if positionGrid is not None and positionGrid.counted > counted:
+        # строка учитывается не более чем в одной ячейке
+        cells[positionGrid.last] -= 1
+        if not cells[positionGrid.last]:
+            del cells[positionGrid.last]
+    extra = {
+        "fuzzy": geocodeFuzzy.matches[:fuzzy_count],
+        "unresolved": unresolved[:unresolved_count],
+        # в порядке появления ячеек, как при обработке без перерыва
+        "cells": [
+            (positionGrid.labels[point], point[0], point[1], rows)
+            for point, rows in cells.items()
+        ],
+    }
+    with stages("checkpoint"):
+        checkpoint.save(
+            digest,
+            position,
+            DIMENSIONS,
+            {name: table.rows() for name, table in CHECKPOINT_TABLES.items()},
+            extra,
         )
 
-    # запись всех данных
-
-    chdir("./output")
 
-    def write_to_csv(filename: str, data, data_class):
+def restore_checkpoint(digest: str) -> int:
+    """Восстановление состояния из контрольной точки, возвращает позицию"""
+    restored = checkpoint.load(digest, DIMENSIONS, DIMENSION_CLASSES)
+    if restored is None:
+        print("контрольной точки для этих входных данных нет, обработка с начала")
+        return 0
+    position, tables, extra = restored
+    for name, table in CHECKPOINT_TABLES.items():
+        table.extend(table.data_class(*row) for row in tables[name])
+    geocodeFuzzy.matches.extend(tuple(match) for match in extra["fuzzy"])
+    unresolved.extend(tuple(row) for row in extra["unresolved"])
+    if positionGrid is not None:
+        positionGrid.merge(extra["cells"])
+    progress.update(position)
+    print(f"продолжение с контрольной точки: строк обработано {position}")
+    return position
+
+
+def update_rows(
+    bad_data_collection: List[CollectionExcelData], previous: Dict[int, RowState]
+) -> Tuple[Dict[int, RowState], int]:
+    """
+    Заполнение таблиц результата: строки с прежним отпечатком берутся
+    из previous, новые и изменённые обрабатываются заново, как и строки,
+    для которых раньше не удалось получить геоданные.
+    Возвращает состояние строк и количество обработанных заново.
+    """
+    digests = [fingerprint(row) for row in bad_data_collection]
+    stale = lambda state, digest: (
+        state is None or state[0] != digest or state[1].region_id is None
+    )
+    changed = [
+        row
+        for row, digest in zip(bad_data_collection, digests)
+        if stale(previous.get(row.id_taxon), digest)
+    ]
+    prefetch_geodata(changed)
+    print(f"запросов к геокодеру в очереди: {len(prefetcher)}")
+    print(f"строк изменено: {len(changed)} из {len(bad_data_collection)}")
+
+    for table in (collection, collectors_to_collection, tags_to_collection):
+        table.clear()
+    rows: Dict[int, RowState] = {}
+    for row, digest in zip(bad_data_collection, digests):
+        state = previous.get(row.id_taxon)
+        if stale(state, digest):
+            state = (digest, *process_row(row))
+        rows[row.id_taxon] = state
+        _, item, collector_links, tag_links = state
+        collection.append(item)
+        collectors_to_collection.extend(collector_links)
+        tags_to_collection.extend(tag_links)
+        progress.update()
+    return rows, len(changed)
+
+
+def run_incremental(inputs: Inputs, sink, parse_workers: int = 1):
+    """
+    Повторный запуск с сохранённым состоянием: заново обрабатываются
+    только новые и изменённые строки, id справочников не меняются
+    """
+    store = StateStore(STATE_FILE)
+    previous = store.load(DIMENSIONS, DIMENSION_CLASSES)
+    collectorResolver.clear()
+    taxonomyResolver.clear()
+    with stages("parse"):
+        bad_data_collection = get_collection(inputs, parse_workers)
+    rows, _ = update_rows(bad_data_collection, previous)
+    write_results(sink)
+    store.save(DIMENSIONS, rows)
+
+
+def run_daemon(inputs: Inputs, delta: bool = False):
+    """
+    Постоянно работающий процесс: справочники, индексы кешей и таблицы
+    разбора остаются в памяти. При изменении входных файлов и по запросам
+    через DAEMON_SOCKET заново обрабатываются только изменённые строки,
+    а файлы в OUTPUT_DIR заменяются атомарно (при delta - с наборами
+    изменений в DELTA_DIR). Запрос {"file": путь или список путей}
+    обрабатывает указанные файлы как новую выгрузку.
+    """
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    store = StateStore(STATE_FILE)
+    state = {"rows": store.load(DIMENSIONS, DIMENSION_CLASSES)}
+    collectorResolver.clear()
+    taxonomyResolver.clear()
+    lock = Lock()
+
+    def update(paths: Inputs) -> Dict[str, Any]:
+        started = perf_counter()
+        stages.reset()
+        unresolved.clear()
+        # каждая обработка - отдельный запуск со своими повторами
+        retryBudget.reset()
+        geocoderBreaker.reset()
+        # ответы прошлых обработок попадают в индексы соседей и похожих описаний
+        posCache.publish()
+        geocodeCache.publish()
+        with stages("parse"):
+            bad_data_collection = get_collection(paths)
+        if not bad_data_collection:
+            # пустая выгрузка заменила бы все таблицы пустыми
+            raise ValueError("нет строк коллекции")
+        rows, changed = update_rows(bad_data_collection, state["rows"])
+        sink = DeltaSink(OUTPUT_DIR, DELTA_DIR) if delta else CsvSink(OUTPUT_DIR, atomic=True)
+        write_results(sink)
+        sink.close()
+        state["rows"] = rows
+        write_unresolved(REVIEW_FILE, unresolved)
+        posCache.flush()
+        geocodeCache.flush()
+        seconds = perf_counter() - started
+        print(f"{paths}: строк {len(bad_data_collection)}, "
+              f"изменено {changed}, {seconds:.2f} с")
+        return {
+            "file": paths,
+            "rows": len(bad_data_collection),
+            "changed": changed,
+            "unresolved": len(unresolved),
+            "seconds": seconds,
+        }
+
+    def process(paths: Inputs) -> Dict[str, Any]:
         """
-        Запись CSV в файл
+        Обработка выгрузки; при ошибке справочники возвращаются
+        к прежнему состоянию, а файлы в OUTPUT_DIR не меняются
         """
-        with open(filename, "w", encoding="utf-8", newline="") as f:
-            DataclassWriter(f, data, data_class).write()
-    
-    write_to_csv("collectors.csv", list(collectors.values()), Collector)
-    write_to_csv("countries.csv", list(countries.values()), Country)
-    write_to_csv("regions.csv", list(regions.values()), Region)
-    write_to_csv("subregions.csv", list(subregions.values()), SubRegion)
-    write_to_csv("orders.csv", list(orders.values()), Order)
-    write_to_csv("families.csv", list(families.values()), Family)
-    write_to_csv("genuses.csv", list(genuses.values()), Genus)
-    write_to_csv("kinds.csv", list(kinds.values()), Kind)
-    write_to_csv("collection.csv", collection, Collection)
-    write_to_csv("collectors_to_collection.csv", collectors_to_collection, CollectorToCollection)
-    write_to_csv("institutes.csv", list(institutes.values()), VoucherInstitute)
-    write_to_csv("tissues.csv", list(tissues.values()), Tissue)
-    write_to_csv("ages.csv", list(filter(lambda age: age != None, set(ages.values()))), Age)
-    write_to_csv("sex.csv", list(filter(lambda sex: sex != None, set(sexes.values()))), Sex)
-    write_to_csv("tags.csv", list(tags.values()), Tag)
-    write_to_csv("tags_to_collection.csv", tags_to_collection, TagToCollection)
+        with lock:
+            saved = {name: dict(dimension) for name, dimension in DIMENSIONS.items()}
+            try:
+                return update(paths)
+            except Exception:
+                for name, dimension in DIMENSIONS.items():
+                    dimension.clear()
+                    dimension.update(saved[name])
+                # запомненные id могли указывать на отброшенные записи
+                collectorResolver.clear()
+                taxonomyResolver.clear()
+                raise
+
+    def watch(paths: Inputs):
+        """Обработка по изменению файлов: ошибка не останавливает демона"""
+        try:
+            process(paths)
+        except Exception as e:
+            print(f"{paths}: {type(e).__name__}: {e}; прежний результат сохранён")
+
+    server = SubmissionServer(
+        DAEMON_SOCKET, lambda request: process(request.get("file", inputs))
+    )
+    server.start()
+    # остановка по SIGTERM так же, как по Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    watcher = FileWatcher(inputs, WATCH_INTERVAL)
+    print(f"ожидание изменений {', '.join(inputs)}, сокет {DAEMON_SOCKET}")
+    try:
+        watch(inputs)
+        while True:
+            watcher.wait()
+            watch(inputs)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        with lock:
+            store.save(DIMENSIONS, state["rows"])
+        server.close()
+
+
+def write_results(sink):
+    """
+    Запись всех данных
+    """
+    with stages("write"):
+        write_dimensions(sink)
+        sink.write("collection", collection, Collection)
+        sink.write("collectors_to_collection", collectors_to_collection, CollectorToCollection)
+        sink.write("tags_to_collection", tags_to_collection, TagToCollection)
+
+
+def build_index() -> CollectionIndex:
+    """Индексы для запросов к результатам обработки прямо из памяти"""
+    return CollectionIndex(
+        collection,
+        collectors_to_collection,
+        tags_to_collection,
+        kinds.values(),
+        genuses.values(),
+        regions.values(),
+        collectors.values(),
+        tags.values(),
+    )
+
+
+def write_grid_report(filename: str, grid: Quantizer):
+    """Отчёт о том, сколько строк определено через каждую ячейку сетки"""
+    with open(filename, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["cell", "lat", "lon", "rows"])
+        writer.writerows(grid.report())
+
+
+def write_unresolved(filename: str, rows: List[Tuple[int, str, str, str]]):
+    """
+    Строки без геоданных для ручной проверки;
+    если таких нет, файл прошлого запуска удаляется
+    """
+    if not rows:
+        if os.path.exists(filename):
+            os.remove(filename)
+        return
+    with open(filename, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id_taxon", "type", "query", "reason"])
+        writer.writerows(rows)
+
+
+def write_fuzzy_log(filename: str, matches: List[Tuple[str, str, float]]):
+    """Журнал запросов, определённых по похожим описаниям, для проверки"""
+    with open(filename, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["query", "matched", "similarity"])
+        for query, matched, similarity in matches:
+            writer.writerow([query, matched, f"{similarity:.3f}"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нормализация данных коллекции")
+    parser.add_argument(
+        "--input",
+        nargs="+",
+        default=[INPUT_FILE],
+        metavar="FILE",
+        help=f"таблицы коллекции в csv или xlsx, читаются подряд (по умолчанию {INPUT_FILE})",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="потоковая обработка без накопления строк в памяти",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="количество процессов для нормализации (кроме режима --stream)",
+    )
+    parser.add_argument(
+        "--parse-workers",
+        type=int,
+        default=1,
+        help="количество процессов для разбора csv (кроме режимов --stream и --daemon)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help=f"обрабатывать только новые и изменённые строки, состояние в {STATE_FILE}",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help=f"продолжить прерванный запуск с контрольной точки {CHECKPOINT_FILE}",
+    )
+    parser.add_argument(
+        "--sink",
+        choices=["csv", "sqlite"],
+        default="csv",
+        help=f"куда записывать таблицы: CSV в {OUTPUT_DIR} или SQLite {SQLITE_FILE}",
+    )
+    parser.add_argument(
+        "--delta",
+        action="store_true",
+        help=f"записать в {DELTA_DIR} вставленные, изменённые и удалённые строки относительно прежних таблиц в {OUTPUT_DIR}",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help=f"записать профиль cProfile в {PROFILE_FILE} и учитывать память через tracemalloc",
+    )
+    parser.add_argument(
+        "--quantize",
+        metavar="SPEC",
+        help='привязка координат к сетке: "decimals:N" или "geohash:P" (см. POSITION_QUANTIZATION)',
+    )
+    parser.add_argument(
+        "--compact-cache",
+        action="store_true",
+        help="удалить дубликаты из журналов кеша геокодера и выйти",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help=f"работать постоянно: обрабатывать изменения входных файлов и задания через {DAEMON_SOCKET}",
+    )
+    parser.add_argument(
+        "--submit",
+        nargs="*",
+        metavar="FILE",
+        help="передать файлы (по умолчанию --input) на обработку запущенному демону и выйти",
+    )
+    args = parser.parse_args()
+    if args.quantize is not None:
+        try:
+            positionGrid = Quantizer.parse(args.quantize)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.submit is not None:
+        files = [os.path.abspath(path) for path in args.submit or args.input]
+        response = submit(DAEMON_SOCKET, {"file": files})
+        print(response)
+        raise SystemExit(1 if "error" in response else 0)
+    if args.compact_cache:
+        for cache in (posCache, geocodeCache):
+            removed = cache.compact()
+            print(f"{cache.name}: {len(cache)} записей, удалено {removed}")
+        raise SystemExit
+    if args.incremental and (args.stream or args.workers > 1):
+        parser.error("--incremental нельзя сочетать с --stream и --workers")
+    if args.resume and (args.stream or args.workers > 1 or args.incremental or args.daemon):
+        parser.error("--resume работает только в обычном режиме без --workers")
+    if args.delta and args.sink != "csv":
+        parser.error("--delta работает только с --sink csv")
+    if args.daemon:
+        if args.stream or args.workers > 1 or args.incremental or args.sink != "csv":
+            parser.error("--daemon нельзя сочетать с другими режимами")
+        try:
+            run_daemon(args.input, args.delta)
+        finally:
+            prefetcher.shutdown()
+            posCache.flush()
+            geocodeCache.flush()
+        raise SystemExit
+
+    if args.profile:
+        profiler = cProfile.Profile()
+        tracemalloc.start()
+        profiler.enable()
+
+    started = perf_counter()
+    if args.sink == "sqlite":
+        sink = SqliteSink(SQLITE_FILE)
+    else:
+        sink = DeltaSink(OUTPUT_DIR, DELTA_DIR) if args.delta else CsvSink(OUTPUT_DIR)
+    try:
+        if args.stream:
+            run_stream(args.input, sink)
+        elif args.incremental:
+            run_incremental(args.input, sink, args.parse_workers)
+        else:
+            run(args.input, sink, args.workers, args.parse_workers, args.resume)
+        sink.close()
+        if not (args.stream or args.incremental):
+            # таблицы записаны, продолжать больше нечего
+            checkpoint.remove()
+    finally:
+        prefetcher.shutdown()
+        # сохраняем полученные ответы геокодера даже при ошибке
+        posCache.flush()
+        geocodeCache.flush()
+    progress.finish()
+
+    report = {
+        "mode": "stream" if args.stream else "incremental" if args.incremental else "full",
+        "workers": args.workers,
+        "rows": progress.count,
+        "seconds": perf_counter() - started,
+        "stages": stages.totals,
+        "caches": {
+            posCache.name: posCache.to_json(),
+            geocodeCache.name: geocodeCache.to_json(),
+            "nearest_resolved": posNearest.resolved,
+            "fuzzy_resolved": len(geocodeFuzzy.matches),
+        },
+        "geocoder": {
+            **geocoderStats.to_json(),
+            "retries_left": retryBudget.left,
+            "breaker_open": geocoderBreaker.open,
+        },
+        "unresolved": len(unresolved),
+    }
+    if args.delta:
+        report["delta"] = sink.counts
+    if positionGrid is not None:
+        report["grid"] = {
+            "mode": f"{positionGrid.mode}:{positionGrid.precision}",
+            "cells": len(positionGrid.cells),
+            "rows": sum(positionGrid.cells.values()),
+            "max_rows": max(positionGrid.cells.values(), default=0),
+        }
+    if args.profile:
+        profiler.disable()
+        profiler.dump_stats(PROFILE_FILE)
+        current, peak = tracemalloc.get_traced_memory()
+        report["memory"] = {
+            "current_bytes": current,
+            "peak_bytes": peak,
+            "top": [
+                str(stat)
+                for stat in tracemalloc.take_snapshot().statistics("lineno")[:10]
+            ],
+        }
+        tracemalloc.stop()
+    write_report(REPORT_FILE, report)
+    write_unresolved(REVIEW_FILE, unresolved)
+    if geocodeFuzzy.matches:
+        write_fuzzy_log(FUZZY_LOG_FILE, geocodeFuzzy.matches)
+    if positionGrid is not None:
+        write_grid_report(GRID_REPORT_FILE, positionGrid)
+
+    print(posCache.report())
+    print(f"определено по соседним точкам: {posNearest.resolved}")
+    print(geocodeCache.report())
+    print(f"определено по похожим описаниям: {len(geocodeFuzzy.matches)}")
+    if unresolved:
+        print(f"строк без геоданных: {len(unresolved)}, список в {REVIEW_FILE}")
+    if positionGrid is not None:
+        cells = positionGrid.cells
+        print(f"ячеек сетки: {len(cells)}, строк в них: {sum(cells.values())}")
+    if args.delta:
+        changed = {name: counts for name, counts in sink.counts.items() if any(counts.values())}
+        for name, counts in changed.items():
+            print(f"{name}: +{counts['inserts']} ~{counts['updates']} -{counts['deletes']}")
+        print(f"наборы изменений: {DELTA_DIR}, изменено таблиц: {len(changed)}")
+    for name, seconds in stages.totals.items():
+        print(f"{name}: {seconds:.2f} с")
+    print(f"отчёт о запуске: {REPORT_FILE}")
@@ -0,0 +1,212 @@
+"""
+Запросы к нормализованным таблицам коллекции в памяти.
+
+Таблицы загружаются из ./output/ (или берутся прямо из справочников
+main.py после обработки), по колонкам строятся индексы: хеш-индексы
+по виду, региону, коллектору и метке и отсортированный индекс по году.
+Фильтры пересекают множества id, начиная с самого маленького.
+
+Пример из командной строки:
+    python query.py --kind "spermophilus undulatus" --year-from 2000
+"""
+import argparse
+import csv
+import dataclasses
+import os
+import sys
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Optional, Set, Type, Union
+
+from dclasses.Collection import Collection
+from dclasses.Collector import Collector
+from dclasses.CollectorToCollection import CollectorToCollection
+from dclasses.Genus import Genus
+from dclasses.Kind import Kind
+from dclasses.Region import Region
+from dclasses.Tag import Tag, TagToCollection
+
+# значение фильтра: один id или несколько
+Ids = Union[int, Iterable[int]]
+
+
+def read_table(filename: str, data_class: Type) -> List:
+    """Чтение CSV из ./output/ в объекты data_class; пустые int - None"""
+    converters = [
+        (lambda v: int(v) if v != "" else None) if field.type is int else str
+        for field in dataclasses.fields(data_class)
+    ]
+    with open(filename, "r", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        return [
+            data_class(*(convert(value) for convert, value in zip(converters, row)))
+            for row in reader
+        ]
+
+
+def _as_set(ids: Ids) -> Set[int]:
+    return {ids} if isinstance(ids, int) else set(ids)
+
+
+class CollectionIndex:
+    """Индексы по таблице коллекции и связанным таблицам"""
+
+    def __init__(
+        self,
+        collection: Iterable[Collection],
+        collector_links: Iterable[CollectorToCollection],
+        tag_links: Iterable[TagToCollection],
+        kinds: Iterable[Kind] = (),
+        genuses: Iterable[Genus] = (),
+        regions: Iterable[Region] = (),
+        collectors: Iterable[Collector] = (),
+        tags: Iterable[Tag] = (),
+    ):
+        self.rows: Dict[int, Collection] = {}
+        self.by_kind: Dict[int, Set[int]] = {}
+        self.by_region: Dict[int, Set[int]] = {}
+        self.by_collector: Dict[int, Set[int]] = {}
+        self.by_tag: Dict[int, Set[int]] = {}
+        self.collectors_of: Dict[int, List[int]] = {}
+        self.tags_of: Dict[int, List[int]] = {}
+
+        dated = []
+        for item in collection:
+            self.rows[item.id] = item
+            self.by_kind.setdefault(item.kind_id, set()).add(item.id)
+            self.by_region.setdefault(item.region_id, set()).add(item.id)
+            if item.year is not None:
+                dated.append((item.year, item.id))
+        dated.sort()
+        self.years = [year for year, _ in dated]
+        self.year_ids = [id for _, id in dated]
+
+        for link in collector_links:
+            self.by_collector.setdefault(link.collector_id, set()).add(link.collection_id)
+            self.collectors_of.setdefault(link.collection_id, []).append(link.collector_id)
+        for link in tag_links:
+            self.by_tag.setdefault(link.tag_id, set()).add(link.col_id)
+            self.tags_of.setdefault(link.col_id, []).append(link.tag_id)
+
+        self.kinds = {item.id: item for item in kinds}
+        self.genuses = {item.id: item for item in genuses}
+        self.regions = {item.id: item for item in regions}
+        self.collectors = {item.id: item for item in collectors}
+        self.tags = {item.id: item for item in tags}
+
+    @classmethod
+    def from_output(cls, directory: str = "./output") -> "CollectionIndex":
+        """Загрузка таблиц, записанных main.py в CSV"""
+        path = lambda name: os.path.join(directory, f"{name}.csv")
+        return cls(
+            read_table(path("collection"), Collection),
+            read_table(path("collectors_to_collection"), CollectorToCollection),
+            read_table(path("tags_to_collection"), TagToCollection),
+            read_table(path("kinds"), Kind),
+            read_table(path("genuses"), Genus),
+            read_table(path("regions"), Region),
+            read_table(path("collectors"), Collector),
+            read_table(path("tags"), Tag),
+        )
+
+    def select(
+        self,
+        kind_id: Optional[Ids] = None,
+        region_id: Optional[Ids] = None,
+        collector_id: Optional[Ids] = None,
+        tag_id: Optional[Ids] = None,
+        year_from: Optional[int] = None,
+        year_to: Optional[int] = None,
+    ) -> List[Collection]:
+        """
+        Записи коллекции, подходящие под все заданные условия, в порядке id.
+        Несколько id в одном условии объединяются через «или».
+        """
+        candidates: List[Set[int]] = []
+        for index, ids in (
+            (self.by_kind, kind_id),
+            (self.by_region, region_id),
+            (self.by_collector, collector_id),
+            (self.by_tag, tag_id),
+        ):
+            if ids is not None:
+                found: Set[int] = set()
+                for id in _as_set(ids):
+                    found |= index.get(id, set())
+                candidates.append(found)
+        by_year = year_from is not None or year_to is not None
+        if not candidates:
+            if not by_year:
+                return [self.rows[id] for id in sorted(self.rows)]
+            # только год: срез отсортированного индекса
+            start = 0 if year_from is None else bisect_left(self.years, year_from)
+            end = len(self.years) if year_to is None else bisect_right(self.years, year_to)
+            return [self.rows[id] for id in sorted(self.year_ids[start:end])]
+
+        candidates.sort(key=len)
+        result = candidates[0].intersection(*candidates[1:])
+        rows = [self.rows[id] for id in sorted(result)]
+        if by_year:
+            # после хеш-индексов строк мало, год проверяется напрямую
+            low = -sys.maxsize if year_from is None else year_from
+            high = sys.maxsize if year_to is None else year_to
+            rows = [row for row in rows if row.year is not None and low <= row.year <= high]
+        return rows
+
+    def kind_ids(self, name: str) -> Set[int]:
+        """id видов по названию: «вид» или «род вид», без учёта регистра"""
+        parts = name.lower().split()
+        genus = parts[0] if len(parts) > 1 else None
+        return {
+            kind.id
+            for kind in self.kinds.values()
+            if kind.name == parts[-1]
+            and (genus is None or self.genuses[kind.genus_id].name == genus)
+        }
+
+    def region_ids(self, name: str) -> Set[int]:
+        name = name.lower()
+        return {region.id for region in self.regions.values() if region.name.lower() == name}
+
+    def collector_ids(self, last_name: str) -> Set[int]:
+        last_name = last_name.lower()
+        return {
+            collector.id
+            for collector in self.collectors.values()
+            if collector.last_name.lower() == last_name
+        }
+
+    def tag_ids(self, name: str) -> Set[int]:
+        return {tag.id for tag in self.tags.values() if tag.name == name}
+
+    def collectors_for(self, collection_id: int) -> List[Collector]:
+        return [self.collectors[id] for id in self.collectors_of.get(collection_id, [])]
+
+    def tags_for(self, collection_id: int) -> List[Tag]:
+        return [self.tags[id] for id in self.tags_of.get(collection_id, [])]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", default="./output", help="каталог с таблицами")
+    parser.add_argument("--kind", help="вид: «вид» или «род вид»")
+    parser.add_argument("--region", help="регион")
+    parser.add_argument("--collector", help="фамилия коллектора")
+    parser.add_argument("--tag", help="метка, например rna")
+    parser.add_argument("--year-from", type=int)
+    parser.add_argument("--year-to", type=int)
+    args = parser.parse_args()
+
+    index = CollectionIndex.from_output(args.output)
+    rows = index.select(
+        kind_id=index.kind_ids(args.kind) if args.kind else None,
+        region_id=index.region_ids(args.region) if args.region else None,
+        collector_id=index.collector_ids(args.collector) if args.collector else None,
+        tag_id=index.tag_ids(args.tag) if args.tag else None,
+        year_from=args.year_from,
+        year_to=args.year_to,
+    )
+    writer = csv.writer(sys.stdout)
+    writer.writerow([field.name for field in dataclasses.fields(Collection)])
+    writer.writerows(dataclasses.astuple(row) for row in rows)
+    print(f"найдено: {len(rows)}", file=sys.stderr)
@@ -0,0 +1,148 @@
+import csv
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+# виды правил в порядке приоритета
+RULE_KINDS = ("exact", "prefix", "suffix", "substring", "query")
+
+
+class AhoCorasick:
+    """
+    Автомат Ахо-Корасик для поиска сразу всех образцов за один проход
+    по строке. Для каждого образца хранится номер правила.
+    """
+
+    def __init__(self, patterns: List[Tuple[str, int]]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        # минимальный номер правила среди образцов, оканчивающихся в узле
+        self.output: List[Optional[int]] = [None]
+        for pattern, rule in patterns:
+            self._insert(pattern, rule)
+        self._build()
+
+    def _insert(self, pattern: str, rule: int):
+        node = 0
+        for char in pattern:
+            next_node = self.goto[node].get(char)
+            if next_node is None:
+                next_node = len(self.goto)
+                self.goto[node][char] = next_node
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(None)
+            node = next_node
+        if self.output[node] is None or rule < self.output[node]:
+            self.output[node] = rule
+
+    def _build(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fail = self.fail[node]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[child] = self.goto[fail].get(char, 0)
+                inherited = self.output[self.fail[child]]
+                if inherited is not None and (
+                    self.output[child] is None or inherited < self.output[child]
+                ):
+                    self.output[child] = inherited
+
+    def first_rule(self, text: str) -> Optional[int]:
+        """Минимальный номер правила среди образцов, входящих в строку"""
+        best = None
+        node = 0
+        for char in text:
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            rule = self.output[node]
+            if rule is not None and (best is None or rule < best):
+                best = rule
+        return best
+
+
+class RegionRules:
+    """
+    Правила нормализации регионов из файла данных.
+
+    Виды правил:
+    - exact: значение целиком заменяется на replacement;
+    - prefix / suffix: образец отрезается от начала / конца значения,
+      на его место ставится replacement (обычно пустой);
+    - substring: значение, содержащее образец, заменяется на replacement;
+    - query: замена готового запроса к геокодеру целиком.
+
+    Проверки идут в порядке exact, prefix, suffix, substring; из нескольких
+    префиксов и суффиксов выбирается самый длинный, из подстрок - правило,
+    записанное в файле раньше. Правила компилируются один раз, результат
+    запоминается для каждого значения.
+    """
+
+    def __init__(self, rules: List[Tuple[str, str, str]]):
+        self.exact: Dict[str, str] = {}
+        self.prefixes: Dict[str, str] = {}
+        self.suffixes: Dict[str, str] = {}
+        self.queries: Dict[str, str] = {}
+        substrings: List[Tuple[str, int]] = []
+        self.substring_replacements: List[str] = []
+
+        for kind, pattern, replacement in rules:
+            if kind == "exact":
+                self.exact.setdefault(pattern, replacement)
+            elif kind == "prefix":
+                self.prefixes.setdefault(pattern, replacement)
+            elif kind == "suffix":
+                self.suffixes.setdefault(pattern, replacement)
+            elif kind == "substring":
+                substrings.append((pattern, len(self.substring_replacements)))
+                self.substring_replacements.append(replacement)
+            elif kind == "query":
+                self.queries.setdefault(pattern, replacement)
+            else:
+                raise ValueError(f"неизвестный вид правила: {kind!r}")
+
+        # длины образцов от большей к меньшей: побеждает самый длинный
+        self.prefix_lengths = sorted({len(p) for p in self.prefixes}, reverse=True)
+        self.suffix_lengths = sorted({len(p) for p in self.suffixes}, reverse=True)
+        self.automaton = AhoCorasick(substrings)
+        self.memo: Dict[str, str] = {}
+
+    @classmethod
+    def load(cls, filename: str) -> "RegionRules":
+        """Загрузка правил из CSV с колонками kind, pattern, replacement"""
+        with open(filename, "r", encoding="utf-8", newline="") as f:
+            return cls(
+                [(row["kind"], row["pattern"], row["replacement"])
+                 for row in csv.DictReader(f)]
+            )
+
+    def normalize(self, region: str) -> str:
+        result = self.memo.get(region)
+        if result is None:
+            result = self.memo[region] = self._apply(region)
+        return result
+
+    def normalize_query(self, query: str) -> str:
+        return self.queries.get(query, query)
+
+    def _apply(self, region: str) -> str:
+        if region in self.exact:
+            return self.exact[region]
+        for length in self.prefix_lengths:
+            replacement = self.prefixes.get(region[:length])
+            if replacement is not None:
+                return replacement + region[length:]
+        for length in self.suffix_lengths:
+            if length > len(region):
+                continue
+            replacement = self.suffixes.get(region[len(region) - length :])
+            if replacement is not None:
+                return region[: len(region) - length] + replacement
+        rule = self.automaton.first_rule(region)
+        if rule is not None:
+            return self.substring_replacements[rule]
+        return region
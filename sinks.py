@@ -0,0 +1,189 @@
+import dataclasses
+import os
+import sqlite3
+from typing import Dict, Iterable, List, Tuple, Type
+
+from columnar import ColumnarTable
+from csv_stream import CsvStreamWriter
+
+# внешние ключи: таблица -> колонка -> (таблица, колонка)
+FOREIGN_KEYS: Dict[str, Dict[str, Tuple[str, str]]] = {
+    "families": {"order_id": ("orders", "id")},
+    "genuses": {"family_id": ("families", "id")},
+    "kinds": {"genus_id": ("genuses", "id")},
+    "regions": {"country_id": ("countries", "id")},
+    "subregions": {"region_id": ("regions", "id")},
+    "collection": {
+        "kind_id": ("kinds", "id"),
+        "region_id": ("regions", "id"),
+        "vouch_inst_id": ("institutes", "id"),
+        "sex_id": ("sex", "id"),
+        "age_id": ("ages", "id"),
+    },
+    "collectors_to_collection": {
+        "collector_id": ("collectors", "id"),
+        "collection_id": ("collection", "id"),
+    },
+    "tags_to_collection": {
+        "col_id": ("collection", "id"),
+        "tag_id": ("tags", "id"),
+    },
+}
+
+SQL_TYPES = {int: "INTEGER", float: "REAL", str: "TEXT"}
+
+
+def write_table(writer, data):
+    """Запись списка объектов или ColumnarTable через writer таблицы"""
+    with writer:
+        if isinstance(data, ColumnarTable):
+            writer.write_rows(data.rows())
+        else:
+            writer.write_all(data)
+
+
+class CsvSink:
+    """
+    Вывод: отдельный CSV-файл на каждую таблицу.
+
+    При atomic=True таблицы пишутся во временные файлы и заменяют
+    прежние только в close, так что читатели не видят частичный вывод.
+    """
+
+    def __init__(self, directory: str, atomic: bool = False):
+        self.directory = directory
+        self.atomic = atomic
+        self.pending: List[str] = []
+
+    def table(self, name: str, data_class: Type) -> CsvStreamWriter:
+        filename = os.path.join(self.directory, f"{name}.csv")
+        if self.atomic:
+            self.pending.append(filename)
+            filename += ".tmp"
+        return CsvStreamWriter(filename, data_class)
+
+    def write(self, name: str, data, data_class: Type):
+        write_table(self.table(name, data_class), data)
+
+    def close(self):
+        for filename in self.pending:
+            os.replace(filename + ".tmp", filename)
+        self.pending.clear()
+
+
+class SqliteTableWriter:
+    """
+    Пакетная вставка строк одной таблицы через executemany.
+
+    CSV принимает строки с повторяющимся id, поэтому здесь вставка идёт
+    через INSERT OR REPLACE: остаётся последняя строка с каждым id,
+    как в query.CollectionIndex, а число заменённых выводится в close.
+    """
+
+    def __init__(
+        self,
+        connection: sqlite3.Connection,
+        name: str,
+        data_class: Type,
+        batch_size: int,
+    ):
+        self.connection = connection
+        self.name = name
+        self.batch_size = batch_size
+        self.buffer: List[Tuple] = []
+        self.written = 0
+        columns = [field.name for field in dataclasses.fields(data_class)]
+        self.keyed = "id" in columns
+        self.insert = (
+            f'INSERT OR REPLACE INTO "{name}" ({", ".join(columns)}) '
+            f'VALUES ({", ".join("?" * len(columns))})'
+        )
+
+    def write(self, item):
+        self.buffer.append(dataclasses.astuple(item))
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def write_all(self, items: Iterable):
+        for item in items:
+            self.write(item)
+
+    def write_rows(self, rows: Iterable[Tuple]):
+        for row in rows:
+            self.buffer.append(row)
+            if len(self.buffer) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.connection.executemany(self.insert, self.buffer)
+            self.written += len(self.buffer)
+            self.buffer.clear()
+
+    def close(self):
+        self.flush()
+        if self.keyed:
+            (rows,) = self.connection.execute(f'SELECT COUNT(*) FROM "{self.name}"').fetchone()
+            if rows < self.written:
+                print(
+                    f"{self.name}: повторяющихся id {self.written - rows}, "
+                    "в SQLite оставлена последняя строка с каждым id"
+                )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SqliteSink:
+    """
+    Вывод всех таблиц в один файл SQLite.
+
+    Загрузка идёт одной транзакцией во временный файл, индексы по внешним
+    ключам строятся после вставки данных, затем файл атомарно заменяет
+    прежний.
+    """
+
+    def __init__(self, filename: str, batch_size: int = 10000):
+        self.filename = filename
+        self.tmp = filename + ".tmp"
+        self.batch_size = batch_size
+        self.tables: List[str] = []
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)
+        self.connection = sqlite3.connect(self.tmp, isolation_level=None)
+        self.connection.execute("PRAGMA synchronous = OFF")
+        self.connection.execute("BEGIN")
+
+    def table(self, name: str, data_class: Type) -> SqliteTableWriter:
+        self._create(name, data_class)
+        return SqliteTableWriter(self.connection, name, data_class, self.batch_size)
+
+    def write(self, name: str, data, data_class: Type):
+        write_table(self.table(name, data_class), data)
+
+    def _create(self, name: str, data_class: Type):
+        foreign_keys = FOREIGN_KEYS.get(name, {})
+        columns = []
+        for field in dataclasses.fields(data_class):
+            column = f"{field.name} {SQL_TYPES.get(field.type, 'TEXT')}"
+            if field.name == "id":
+                column += " PRIMARY KEY"
+            if field.name in foreign_keys:
+                table, key = foreign_keys[field.name]
+                column += f' REFERENCES "{table}" ({key})'
+            columns.append(column)
+        self.connection.execute(f'CREATE TABLE "{name}" ({", ".join(columns)})')
+        self.tables.append(name)
+
+    def close(self):
+        for name in self.tables:
+            for column in FOREIGN_KEYS.get(name, {}):
+                self.connection.execute(
+                    f'CREATE INDEX "{name}_{column}_idx" ON "{name}" ({column})'
+                )
+        self.connection.execute("COMMIT")
+        self.connection.close()
+        os.replace(self.tmp, self.filename)
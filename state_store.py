@@ -0,0 +1,171 @@
+import dataclasses
+import hashlib
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Type
+
+from dclasses.Collection import Collection
+from dclasses.CollectorToCollection import CollectorToCollection
+from dclasses.Tag import TagToCollection
+
+# отпечаток строки, запись коллекции и её связи
+RowState = Tuple[str, Collection, List[CollectorToCollection], List[TagToCollection]]
+
+
+def fingerprint(row) -> str:
+    """Хеш содержимого исходной строки"""
+    return hashlib.sha1(repr(dataclasses.astuple(row)).encode("utf-8")).hexdigest()
+
+
+def _key_to_json(key):
+    return list(key) if isinstance(key, tuple) else key
+
+
+def _key_from_json(key):
+    return tuple(key) if isinstance(key, list) else key
+
+
+def _dump_dimensions(dimensions: Dict[str, Dict]) -> Dict[str, List]:
+    return {
+        name: [[_key_to_json(key), dataclasses.asdict(item)] for key, item in dimension.items()]
+        for name, dimension in dimensions.items()
+    }
+
+
+def _load_dimensions(
+    state: Dict[str, List], dimensions: Dict[str, Dict], classes: Dict[str, Type]
+):
+    """Заполнение справочников на месте: на них ссылаются другие модули"""
+    for name, dimension in dimensions.items():
+        dimension.clear()
+        data_class = classes[name]
+        for key, item in state.get(name, []):
+            dimension[_key_from_json(key)] = data_class(**item)
+
+
+def _write_atomic(filename: str, state: Dict[str, Any]):
+    tmp = filename + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, filename)
+
+
+def inputs_digest(filenames: Sequence[str]) -> str:
+    """Хеш имён и содержимого входных файлов"""
+    digest = hashlib.sha1()
+    for filename in filenames:
+        digest.update(filename.encode("utf-8") + b"\0")
+        with open(filename, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+class StateStore:
+    """
+    Сохранённое между запусками состояние: справочники с их id
+    и результаты обработки каждой строки вместе с отпечатком.
+    Позволяет при повторном запуске обрабатывать только новые
+    и изменённые строки, не сдвигая уже выданные id.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+
+    def load(
+        self, dimensions: Dict[str, Dict], classes: Dict[str, Type]
+    ) -> Dict[int, RowState]:
+        """
+        Заполнение справочников сохранёнными значениями.
+        Возвращает состояние строк по id_taxon.
+        """
+        if not os.path.exists(self.filename):
+            return {}
+        with open(self.filename, "r", encoding="utf-8") as f:
+            state = json.load(f)
+
+        _load_dimensions(state["dimensions"], dimensions, classes)
+
+        rows: Dict[int, RowState] = {}
+        for id_taxon, digest, item, collector_ids, tag_ids in state["rows"]:
+            rows[id_taxon] = (
+                digest,
+                Collection(**item),
+                [CollectorToCollection(c, id_taxon) for c in collector_ids],
+                [TagToCollection(id_taxon, t) for t in tag_ids],
+            )
+        return rows
+
+    def save(self, dimensions: Dict[str, Dict], rows: Dict[int, RowState]):
+        """Атомарная запись состояния"""
+        state = {
+            "dimensions": _dump_dimensions(dimensions),
+            "rows": [
+                [
+                    id_taxon,
+                    digest,
+                    dataclasses.asdict(item),
+                    [link.collector_id for link in collector_links],
+                    [link.tag_id for link in tag_links],
+                ]
+                for id_taxon, (digest, item, collector_links, tag_links) in rows.items()
+            ],
+        }
+        _write_atomic(self.filename, state)
+
+
+class Checkpoint:
+    """
+    Контрольная точка полного запуска: сколько строк уже обработано,
+    справочники и накопленные таблицы. Привязана к хешу входных файлов,
+    чтобы не продолжить обработку других данных.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+
+    def save(
+        self,
+        digest: str,
+        position: int,
+        dimensions: Dict[str, Dict],
+        tables: Dict[str, Iterable[Tuple]],
+        extra: Dict[str, Any],
+    ):
+        """
+        Атомарная запись. tables - строки таблиц кортежами значений,
+        extra - прочие данные, влияющие на результат.
+        """
+        _write_atomic(
+            self.filename,
+            {
+                "inputs": digest,
+                "position": position,
+                "dimensions": _dump_dimensions(dimensions),
+                "tables": {name: list(rows) for name, rows in tables.items()},
+                "extra": extra,
+            },
+        )
+
+    def load(
+        self, digest: str, dimensions: Dict[str, Dict], classes: Dict[str, Type]
+    ) -> Optional[Tuple[int, Dict[str, List[List]], Dict[str, Any]]]:
+        """
+        Заполнение справочников из контрольной точки.
+        Возвращает позицию, накопленные таблицы и extra
+        или None, если точки нет или она сделана для других входных данных.
+        """
+        if not os.path.exists(self.filename):
+            return None
+        with open(self.filename, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state["inputs"] != digest:
+            return None
+        _load_dimensions(state["dimensions"], dimensions, classes)
+        return state["position"], state["tables"], state["extra"]
+
+    def remove(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
@@ -0,0 +1,85 @@
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from dclasses.Family import Family
+from dclasses.Genus import Genus
+from dclasses.Kind import Kind
+from dclasses.Order import Order
+
+# исходные значения колонок «Отряд», «Семейство», «Род», «Вид»
+RawTaxon = Tuple[str, str, str, str]
+
+
+class TaxonomyResolver:
+    """
+    Сопоставление таксономии строки (отряд, семейство, род, вид)
+    с id вида в справочниках orders, families, genuses, kinds.
+
+    Каждое сочетание исходных значений разбирается один раз, дальше -
+    один поиск в словаре. Пакетный разбор resolve_all проходит уникальные
+    сочетания в порядке появления, поэтому id совпадают с построчной
+    обработкой. При очистке или замене справочников нужно вызвать clear.
+    """
+
+    def __init__(
+        self,
+        orders: Dict[str, Order],
+        families: Dict[Tuple[int, str], Family],
+        genuses: Dict[Tuple[int, str], Genus],
+        kinds: Dict[Tuple[int, str], Kind],
+        clean: Callable[[str], str],
+    ):
+        self.orders = orders
+        self.families = families
+        self.genuses = genuses
+        self.kinds = kinds
+        self.clean = clean
+        self.memo: Dict[RawTaxon, int] = {}
+
+    def resolve(self, order: str, family: str, genus: str, kind: str) -> int:
+        """id вида; новые значения добавляются в справочники"""
+        raw = (order, family, genus, kind)
+        kind_id = self.memo.get(raw)
+        if kind_id is None:
+            kind_id = self.memo[raw] = self._create(raw)
+        return kind_id
+
+    def resolve_all(self, taxa: Iterable[RawTaxon]) -> List[int]:
+        """
+        Пакетный разбор: уникальные сочетания в порядке появления,
+        затем колонка id вида для всех строк
+        """
+        taxa = list(taxa)
+        memo = self.memo
+        for raw in dict.fromkeys(taxa):
+            if raw not in memo:
+                memo[raw] = self._create(raw)
+        return [memo[raw] for raw in taxa]
+
+    def clear(self):
+        self.memo.clear()
+
+    def _create(self, raw: RawTaxon) -> int:
+        order, family, genus, kind = (self.clean(value) for value in raw)
+
+        item = self.orders.get(order)
+        if item is None:
+            item = self.orders[order] = Order(len(self.orders) + 1, order)
+        order_id = item.id
+
+        item = self.families.get((order_id, family))
+        if item is None:
+            item = Family(len(self.families) + 1, order_id, family)
+            self.families[(order_id, family)] = item
+        family_id = item.id
+
+        item = self.genuses.get((family_id, genus))
+        if item is None:
+            item = Genus(len(self.genuses) + 1, family_id, genus)
+            self.genuses[(family_id, genus)] = item
+        genus_id = item.id
+
+        item = self.kinds.get((genus_id, kind))
+        if item is None:
+            item = Kind(len(self.kinds) + 1, genus_id, kind)
+            self.kinds[(genus_id, kind)] = item
+        return item.id